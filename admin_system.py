@@ -4,8 +4,9 @@ Uses SQLite on Render Persistent Disk
 """
 
 import streamlit as st
-import sqlite3
 import auth
+import db
+import entitlements
 import secrets
 from datetime import datetime, timedelta
 
@@ -13,99 +14,75 @@ ADMIN_EMAILS = [
     "mikemusic845@gmail.com",
 ]
 
+USERS_PER_PAGE = 25
+
 def is_admin(email):
     return email.lower() in [e.lower() for e in ADMIN_EMAILS]
 
-def init_admin_tables():
-    conn = sqlite3.connect(auth.DB_PATH)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS discount_codes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        code TEXT UNIQUE NOT NULL,
-        discount_percent INTEGER,
-        plan_override TEXT,
-        uses_remaining INTEGER,
-        expires_at TIMESTAMP,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS user_overrides (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        override_type TEXT NOT NULL,
-        reason TEXT,
-        granted_by TEXT,
-        expires_at TIMESTAMP,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )''')
-    conn.commit()
-    conn.close()
-
 def grant_user_access(user_email, plan='premium', duration_days=None, reason=''):
-    conn = sqlite3.connect(auth.DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT id FROM users WHERE email = ?', (user_email,))
-    user = c.fetchone()
-    if not user:
-        conn.close()
-        return False, "User not found"
-    user_id = user[0]
-    c.execute('UPDATE users SET plan = ? WHERE id = ?', (plan, user_id))
-    expires_at = None
-    if duration_days:
-        expires_at = datetime.now() + timedelta(days=duration_days)
-    admin_email = st.session_state.user.get('email', 'system')
-    c.execute('''INSERT INTO user_overrides (user_id, override_type, reason, granted_by, expires_at)
-                 VALUES (?, ?, ?, ?, ?)''',
-              (user_id, f'plan_{plan}', reason, admin_email, expires_at))
-    conn.commit()
-    conn.close()
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute('SELECT id FROM users WHERE email = ?', (user_email,))
+        user = c.fetchone()
+        if not user:
+            return False, "User not found"
+        user_id = user[0]
+        # Restored when a timed grant expires, e.g. a paid plan from before the webhook
+        previous_plan = entitlements.base_plan(conn, user_id)
+        c.execute('UPDATE users SET plan = ? WHERE id = ?', (plan, user_id))
+        expires_at = None
+        if duration_days:
+            expires_at = datetime.now() + timedelta(days=duration_days)
+        admin_email = st.session_state.user.get('email', 'system')
+        c.execute('''INSERT INTO user_overrides (user_id, override_type, reason, granted_by, expires_at, previous_plan)
+                     VALUES (?, ?, ?, ?, ?, ?)''',
+                  (user_id, f'plan_{plan}', reason, admin_email, expires_at, previous_plan))
+    auth.invalidate_user_stats(user_id)
+    entitlements.invalidate(user_id)
     if st.session_state.get('user') and st.session_state.user['email'] == user_email:
         st.session_state.user['plan'] = plan
     return True, f"✅ Granted {plan} access to {user_email}"
 
 def create_discount_code(code, discount_percent=None, plan_override=None, uses=None, days_valid=None):
-    conn = sqlite3.connect(auth.DB_PATH)
-    c = conn.cursor()
     expires_at = None
     if days_valid:
         expires_at = datetime.now() + timedelta(days=days_valid)
     try:
-        c.execute('''INSERT INTO discount_codes (code, discount_percent, plan_override, uses_remaining, expires_at)
-                     VALUES (?, ?, ?, ?, ?)''',
-                  (code.upper(), discount_percent, plan_override, uses, expires_at))
-        conn.commit()
-        conn.close()
+        with db.transaction() as conn:
+            conn.execute('''INSERT INTO discount_codes (code, discount_percent, plan_override, uses_remaining, expires_at)
+                            VALUES (?, ?, ?, ?, ?)''',
+                         (code.upper(), discount_percent, plan_override, uses, expires_at))
         return True, f"✅ Created discount code: {code.upper()}"
-    except sqlite3.IntegrityError:
-        conn.close()
+    except db.IntegrityError:
         return False, "Code already exists"
 
 def apply_discount_code(user_id, code):
-    conn = sqlite3.connect(auth.DB_PATH)
-    c = conn.cursor()
-    c.execute('''SELECT id, discount_percent, plan_override, uses_remaining, expires_at
-                 FROM discount_codes WHERE code = ?''', (code.upper(),))
-    discount = c.fetchone()
-    if not discount:
-        conn.close()
-        return False, "Invalid code"
-    discount_id, discount_percent, plan_override, uses_remaining, expires_at = discount
-    if expires_at and datetime.fromisoformat(str(expires_at)) < datetime.now():
-        conn.close()
-        return False, "Code expired"
-    if uses_remaining is not None and uses_remaining <= 0:
-        conn.close()
-        return False, "Code has been fully used"
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT id, discount_percent, plan_override, uses_remaining, expires_at
+                     FROM discount_codes WHERE code = ?''', (code.upper(),))
+        discount = c.fetchone()
+        if not discount:
+            return False, "Invalid code"
+        discount_id, discount_percent, plan_override, uses_remaining, expires_at = discount
+        if expires_at and datetime.fromisoformat(str(expires_at)) < datetime.now():
+            return False, "Code expired"
+        if uses_remaining is not None and uses_remaining <= 0:
+            return False, "Code has been fully used"
+        if plan_override:
+            c.execute('UPDATE users SET plan = ? WHERE id = ?', (plan_override, user_id))
+            # Supersedes any timed grant, which would otherwise lapse this plan
+            c.execute('''INSERT INTO user_overrides (user_id, override_type, reason, granted_by)
+                         VALUES (?, ?, ?, ?)''',
+                      (user_id, f'plan_{plan_override}', f'Discount code {code.upper()}', 'discount_code'))
+            message = f"✅ Applied! You now have {plan_override} access"
+        else:
+            message = f"✅ {discount_percent}% discount applied"
+        if uses_remaining is not None:
+            c.execute('UPDATE discount_codes SET uses_remaining = uses_remaining - 1 WHERE id = ?', (discount_id,))
     if plan_override:
-        c.execute('UPDATE users SET plan = ? WHERE id = ?', (plan_override, user_id))
-        message = f"✅ Applied! You now have {plan_override} access"
-    else:
-        message = f"✅ {discount_percent}% discount applied"
-    if uses_remaining is not None:
-        c.execute('UPDATE discount_codes SET uses_remaining = uses_remaining - 1 WHERE id = ?', (discount_id,))
-    conn.commit()
-    conn.close()
+        auth.invalidate_user_stats(user_id)
+        entitlements.invalidate(user_id)
     return True, message
 
 def show_admin_panel():
@@ -113,7 +90,7 @@ def show_admin_panel():
         return
     st.markdown("---")
     st.markdown("## 🔧 Admin Panel")
-    tab1, tab2, tab3 = st.tabs(["Grant Access", "Discount Codes", "User Management"])
+    tab1, tab2, tab3, tab4 = st.tabs(["Grant Access", "Discount Codes", "User Management", "Performance"])
 
     with tab1:
         st.markdown("### Grant User Access")
@@ -170,15 +147,29 @@ def show_admin_panel():
 
     with tab3:
         st.markdown("### User Management")
-        conn = sqlite3.connect(auth.DB_PATH)
-        c = conn.cursor()
-        c.execute('SELECT email, plan, reports_analyzed, created_at FROM users ORDER BY created_at DESC LIMIT 50')
-        users = c.fetchall()
-        conn.close()
+        col1, col2 = st.columns([2, 1])
+        with col1:
+            email_prefix = st.text_input("Search by email", placeholder="Start of an email address",
+                                         key="admin_user_search").strip()
+        with col2:
+            plan_filter = st.selectbox("Plan", ["All", "free", "basic", "pro", "premium"], key="admin_user_plan")
+        plan_filter = None if plan_filter == "All" else plan_filter
+
+        # Keyset pagination: remember the after_id each visited page started from
+        filters = (email_prefix, plan_filter)
+        if st.session_state.get('admin_user_filters') != filters:
+            st.session_state.admin_user_filters = filters
+            st.session_state.admin_user_pages = [None]
+        pages = st.session_state.admin_user_pages
+
+        total = auth.count_users(email_prefix, plan_filter)
+        users = auth.get_users_page(pages[-1], USERS_PER_PAGE, email_prefix, plan_filter)
+        label = "Matching Users" if email_prefix or plan_filter else "Total Users"
+        st.markdown(f"**{label}: {total:,}** · page {len(pages)} of {max(1, -(-total // USERS_PER_PAGE))}")
+
         if users:
-            st.markdown(f"**Total Users: {len(users)}**")
             for user in users:
-                email, plan, reports, created = user
+                user_id, email, plan, reports, disputes, created = user
                 with st.expander(f"{email} - {plan} plan"):
                     st.write(f"Reports Analyzed: {reports}")
                     st.write(f"Joined: {created}")
@@ -195,6 +186,69 @@ def show_admin_panel():
                         if st.button("Make Pro", key=f"pro_{email}"):
                             grant_user_access(email, 'pro', reason='Admin override')
                             st.rerun()
+        else:
+            st.info("No users match these filters.")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("← Newer", disabled=len(pages) == 1, use_container_width=True, key="admin_users_prev"):
+                pages.pop()
+                st.rerun()
+        with col2:
+            if st.button("Older →", disabled=len(users) < USERS_PER_PAGE, use_container_width=True, key="admin_users_next"):
+                pages.append(users[-1][0])
+                st.rerun()
+
+    with tab4:
+        show_performance_stats()
+
+def show_performance_stats():
+    import text_cache
+    st.markdown("### Extracted Text Cache")
+    stats = text_cache.get_stats()
+    lookups = stats['hits'] + stats['misses']
+    hit_rate = f"{stats['hits'] / lookups:.0%}" if lookups else "—"
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Hits", stats['hits'])
+    col2.metric("Misses", stats['misses'])
+    col3.metric("Hit Rate", hit_rate)
+    col4.metric("Evictions", stats['evictions'])
+    st.caption(f"{stats['entries']} cached reports, {stats['bytes'] / (1024 * 1024):.1f} MB on disk. "
+               "Counters reset when the server restarts.")
+
+    import report_cache
+    st.markdown("### Parsed Report Cache")
+    stats = report_cache.get_stats()
+    lookups = stats['hits'] + stats['misses']
+    hit_rate = f"{stats['hits'] / lookups:.0%}" if lookups else "—"
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Hits", stats['hits'])
+    col2.metric("Misses", stats['misses'])
+    col3.metric("Hit Rate", hit_rate)
+    col4.metric("Evictions", stats['evictions'])
+    st.caption(f"{stats['entries']} cached parses, {stats['bytes'] / 1024:.0f} KB stored.")
+
+    import rate_limiter
+    st.markdown("### Sign-in Rate Limiting")
+    stats = rate_limiter.get_stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Allowed", stats['allowed'])
+    col2.metric("Blocked", stats['blocked'])
+    col3.metric("Failed Logins", stats['failures'])
+    col4.metric("Replays Skipped", stats['failed_cache_hits'])
+    st.caption(f"Tracking {stats['tracked_emails']} emails and {stats['tracked_clients']} clients "
+               f"({stats['evictions']} evicted), {stats['failed_cache_entries']} remembered failures.")
+
+    import stripe_gateway
+    st.markdown("### Stripe Lookups")
+    stats = stripe_gateway.get_stats()
+    lookups = stats['hits'] + stats['misses']
+    hit_rate = f"{stats['hits'] / lookups:.0%}" if lookups else "—"
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Cache Hits", stats['hits'])
+    col2.metric("API Calls", stats['api_calls'])
+    col3.metric("Hit Rate", hit_rate)
+    col4.metric("Cached", stats['entries'])
 
 def show_discount_code_input():
     if st.session_state.user['plan'] == 'free':
@@ -211,9 +265,3 @@ def show_discount_code_input():
                             st.rerun()
                         else:
                             st.error(message)
-
-# Initialize admin tables on import
-try:
-    init_admin_tables()
-except Exception:
-    pass
@@ -0,0 +1,59 @@
+"""
+Shared Anthropic Client for Credit CPR
+One pooled client per process so every AI call reuses warm connections
+"""
+
+import os
+import threading
+import httpx
+import streamlit as st
+
+# Connection pool shared by parses, analyses, letters and chat
+MAX_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY = 120.0
+
+# Long completions stream for up to a couple of minutes; connecting should be quick
+TIMEOUT = httpx.Timeout(180.0, connect=10.0)
+
+# The SDK retries 408/409/429/5xx and connection errors with exponential backoff
+MAX_RETRIES = int(os.getenv("ANTHROPIC_MAX_RETRIES", "3"))
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_api_key() -> str:
+    try:
+        key = st.secrets.get("ANTHROPIC_API_KEY", "")
+    except Exception:
+        key = ""
+    if not key:
+        key = os.getenv("ANTHROPIC_API_KEY", "")
+    return key
+
+
+def get_client(api_key: str = None):
+    """Return the process-wide Anthropic client for api_key, creating it once"""
+    api_key = api_key or get_api_key()
+    with _lock:
+        client = _clients.get(api_key)
+        if client is None:
+            from anthropic import Anthropic
+
+            http_client = httpx.Client(
+                timeout=TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+            )
+            client = Anthropic(
+                api_key=api_key,
+                timeout=TIMEOUT,
+                max_retries=MAX_RETRIES,
+                http_client=http_client,
+            )
+            _clients[api_key] = client
+        return client
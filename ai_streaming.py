@@ -0,0 +1,39 @@
+"""
+Streaming AI Responses for Credit CPR
+Renders model output into the page as tokens arrive
+"""
+
+import time
+
+# Minimum seconds between placeholder redraws while streaming
+RENDER_INTERVAL = 0.05
+CURSOR = "▌"
+
+
+def _render(placeholder, text, as_text):
+    if as_text:
+        placeholder.text(text)
+    else:
+        placeholder.markdown(text)
+
+
+def stream_text(client, placeholder=None, as_text=False, wrap=None, **request) -> str:
+    """Stream a messages request, redrawing placeholder (an st.empty()) as text arrives.
+
+    request takes the same keyword arguments as client.messages.create.
+    wrap(partial_text), if given, returns what to display around the partial text.
+    Returns the complete response text.
+    """
+    wrap = wrap or (lambda text: text)
+    parts = []
+    last_render = 0.0
+    with client.messages.stream(**request) as stream:
+        for chunk in stream.text_stream:
+            parts.append(chunk)
+            if placeholder is not None and time.monotonic() - last_render >= RENDER_INTERVAL:
+                _render(placeholder, wrap("".join(parts) + CURSOR), as_text)
+                last_render = time.monotonic()
+    text = "".join(parts)
+    if placeholder is not None:
+        _render(placeholder, wrap(text), as_text)
+    return text
@@ -0,0 +1,185 @@
+"""
+Analysis Pipeline for Credit CPR
+Overlaps report parsing and error analysis so results stream in as each stage finishes
+"""
+
+import re
+import copy
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import report_chunking
+import error_rules
+
+MAX_WORKERS = 4
+
+# Sections analyzed as soon as their chunk is parsed, one model call per group
+EARLY_GROUPS = (("negative_items", "public_records"),)
+EARLY_SECTIONS = ("negative_items", "public_records")
+# Sections that wait for every chunk: the duplicate-account and inquiry rules
+# compare against the whole report
+LATE_GROUPS = (("accounts",), ("inquiries",))
+LATE_SECTIONS = ("accounts", "inquiries")
+# Personal info is reviewed once, alongside the accounts
+PERSONAL_INFO_GROUP = ("accounts",)
+
+EMPTY_REPORT = {
+    "personal_info": {"name": "Unable to parse", "addresses": [], "ssn_last4": "", "dob": ""},
+    "accounts": [],
+    "inquiries": [],
+    "public_records": [],
+    "negative_items": []
+}
+
+
+def _subset(credit_data: dict, sections) -> dict:
+    data = {"personal_info": (credit_data.get("personal_info") or {}) if tuple(sections) == PERSONAL_INFO_GROUP else {}}
+    for section in error_rules.ALL_SECTIONS:
+        data[section] = (credit_data.get(section) or []) if section in sections else []
+    return data
+
+
+def _error_key(error: dict) -> tuple:
+    return (str(error.get("category", "")).lower(),
+            re.sub(r"[^a-z0-9]", "", str(error.get("affected_item", "")).lower()))
+
+
+def _finalize_errors(errors: list) -> list:
+    """Drop repeated findings, from the rules or the model, and give every error a unique id"""
+    seen = set()
+    final = []
+    for error in errors:
+        key = _error_key(error)
+        if key in seen:
+            continue
+        seen.add(key)
+        final.append(dict(error))
+    rule_n = model_n = 0
+    for error in final:
+        if error.get("source") == "rules":
+            rule_n += 1
+            error["id"] = f"RULE{rule_n:03d}"
+        else:
+            model_n += 1
+            error["id"] = f"ERR{model_n:03d}"
+    return final
+
+
+def run_analysis(raw_text, parse_chunk, analyze_section, preparsed=None, max_workers=MAX_WORKERS):
+    """Parse and analyze a report, yielding events as each stage completes.
+
+    parse_chunk(text) -> partial report dict, or None if the reply was unusable
+    analyze_section(section_data, already_flagged) -> list of model errors, or
+    None if the reply was unusable
+    preparsed, when given, is a complete report (local parser or cache hit)
+    and skips the parse stage.
+
+    Negative items and public records are analyzed chunk by chunk as they are
+    parsed, each item sent to the model once even if two chunks repeat it.
+    Accounts, inquiries and personal info are analyzed on the merged report.
+
+    Events:
+      ("parsed", parsed_count, chunk_count, partial)
+      ("errors", new_errors)
+      ("complete", credit_data, errors, fully_parsed_by_ai, failed_chunks, failed_analyses)
+
+    fully_parsed_by_ai is True only when the model parsed every chunk, i.e.
+    the report is complete and safe to cache. failed_chunks and
+    failed_analyses count the parse and analysis calls that raised or
+    returned None; when every chunk failed, credit_data is EMPTY_REPORT and
+    nothing was actually analyzed.
+    """
+    if preparsed is not None:
+        chunks = []
+    elif len(raw_text) <= report_chunking.CHUNK_CHARS:
+        chunks = [raw_text]
+    else:
+        chunks = [text for _, text in report_chunking.split_report(raw_text)]
+    chunk_count = len(chunks) or 1
+
+    partials = [None] * chunk_count
+    errors = []
+    failed_chunks = 0
+    failed_analyses = 0
+    submitted = set()  # early-section items already sent for analysis
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = {}
+
+        def submit_analysis(residual, groups):
+            flagged = [e for e in errors if e.get("source") == "rules"]
+            for group in groups:
+                section_data = _subset(residual, group)
+                if error_rules.has_residual_items(section_data):
+                    pending[pool.submit(analyze_section, section_data, flagged)] = ("analyze", None)
+
+        def start_early_analysis(partial):
+            fresh = {"accounts": partial.get("accounts") or []}
+            for section in EARLY_SECTIONS:
+                fresh[section] = []
+                for item in partial.get(section) or []:
+                    key = report_chunking.item_key(item) if isinstance(item, dict) else None
+                    if key is not None and key not in submitted:
+                        submitted.add(key)
+                        fresh[section].append(item)
+            rule_errors, residual = error_rules.evaluate(fresh, sections=EARLY_SECTIONS)
+            errors.extend(rule_errors)
+            submit_analysis(residual, EARLY_GROUPS)
+            return rule_errors
+
+        if preparsed is not None:
+            partials[0] = preparsed
+            yield ("parsed", 1, 1, preparsed)
+            new_errors = start_early_analysis(preparsed)
+            if new_errors:
+                yield ("errors", new_errors)
+
+        for index, chunk in enumerate(chunks):
+            pending[pool.submit(parse_chunk, chunk)] = ("parse", index)
+
+        parsed_count = 0 if chunks else 1
+        late_started = False
+        while pending or not late_started:
+            if parsed_count == chunk_count and not late_started:
+                # Every chunk is parsed: check accounts and inquiries across the whole report
+                late_started = True
+                found = [p for p in partials if p is not None]
+                if found:
+                    merged = found[0] if len(found) == 1 else report_chunking.merge_partials(found)
+                    rule_errors, residual = error_rules.evaluate(merged, sections=LATE_SECTIONS)
+                    errors.extend(rule_errors)
+                    if rule_errors:
+                        yield ("errors", rule_errors)
+                    submit_analysis(residual, LATE_GROUPS)
+                continue
+
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, index = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception:
+                    result = None
+                if stage == "parse":
+                    parsed_count += 1
+                    partials[index] = result
+                    yield ("parsed", parsed_count, chunk_count, result)
+                    if result is None:
+                        failed_chunks += 1
+                    else:
+                        new_errors = start_early_analysis(result)
+                        if new_errors:
+                            yield ("errors", new_errors)
+                elif result is None:
+                    failed_analyses += 1
+                elif result:
+                    errors.extend(result)
+                    yield ("errors", result)
+
+    found = [p for p in partials if p is not None]
+    if not found:
+        credit_data = copy.deepcopy(EMPTY_REPORT)
+    elif len(found) == 1:
+        credit_data = found[0]
+    else:
+        credit_data = report_chunking.merge_partials(found)
+    fully_parsed_by_ai = preparsed is None and failed_chunks == 0
+    yield ("complete", credit_data, _finalize_errors(errors), fully_parsed_by_ai, failed_chunks, failed_analyses)
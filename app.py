@@ -5,14 +5,33 @@ A tool to analyze credit reports and generate dispute letters using AI
 
 import streamlit as st
 import json
-import os
-from io import BytesIO
-from docx import Document
-from docx.shared import Pt, Inches
+import hashlib
 from datetime import datetime, timedelta
-import PyPDF2
 import base64
 import auth  # Authentication system
+import db
+import entitlements
+import pdf_extraction
+import text_cache
+import report_cache
+import report_chunking
+import bureau_parsers
+import analysis_pipeline
+import ai_streaming
+import ai_client
+import dispute_batch
+import letter_templates
+import document_builder
+import migrations
+import stripe_webhook
+import password_reset
+
+# Create or upgrade the schema (no-op after the first run in this process)
+migrations.migrate()
+# Receive Stripe webhooks in this process when STRIPE_WEBHOOK_PORT is set
+stripe_webhook.start_background()
+# Purge expired password reset links in the background
+password_reset.start_sweeper()
 
 def get_shield_base64():
     with open("assets/shield.png", "rb") as f:
@@ -159,18 +178,8 @@ st.markdown("""
 
 # Initialize Anthropic client
 def get_anthropic_client():
-    # Try multiple ways to get the API key
-    api_key = None
-    
-    # Method 1: Streamlit secrets
-    try:
-        api_key = st.secrets.get("ANTHROPIC_API_KEY", "")
-    except:
-        pass
-    
-    # Method 2: Environment variable
-    if not api_key:
-        api_key = os.getenv("ANTHROPIC_API_KEY", "")
+    # Streamlit secrets first, then the environment variable
+    api_key = ai_client.get_api_key()
     
     # Check if we got a valid key
     if not api_key or api_key == "":
@@ -201,11 +210,9 @@ def get_anthropic_client():
         st.error(f"Invalid API key format. Key should start with 'sk-ant-' but yours starts with '{api_key[:7]}'")
         st.stop()
     
-    # Try to import and initialize Anthropic
+    # Shared, pooled client (created once per process)
     try:
-        from anthropic import Anthropic
-        client = Anthropic(api_key=api_key)
-        return client
+        return ai_client.get_client(api_key)
     except ImportError:
         st.error("Anthropic library not installed properly!")
         st.info("Run this command: `pip install anthropic`")
@@ -216,44 +223,66 @@ def get_anthropic_client():
         st.stop()
 
 # PDF Parser
-def extract_text_from_pdf(pdf_file):
-    """Extract text from uploaded PDF"""
+def extract_text_from_pdf(pdf_file, progress=None):
+    """Extract text from uploaded PDF, updating an optional st.progress bar"""
+    def on_page(page_number, page_count):
+        if progress is not None:
+            progress.progress(page_number / page_count, text=f"📖 Reading page {page_number} of {page_count}...")
+
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
+        data = pdf_extraction.read_pdf_bytes(pdf_file)
+        digest = text_cache.pdf_digest(data)
+        text = text_cache.get_text(digest)
+        if text is not None:
+            return text
+        text = pdf_extraction.extract_text(data, on_page=on_page)
+        text_cache.put_text(digest, text)
         return text
+    except pdf_extraction.PDFTooLargeError as e:
+        st.error(f"PDF too large: {str(e)}")
+        return None
     except Exception as e:
         st.error(f"Error reading PDF: {str(e)}")
         return None
 
 # AI Functions
-def parse_credit_report_with_ai(raw_text, client):
-    """Use AI to structure the credit report data"""
-    prompt = f"""Analyze this credit report text and extract key information into a structured JSON format.
+PARSE_MODEL = "claude-sonnet-4-20250514"
+
+PARSE_PROMPT_TEMPLATE = """Analyze this credit report text and extract key information into a structured JSON format.
 
 Extract:
 1. Personal Information (name, addresses, SSN if present, DOB)
-2. Accounts (creditor name, account number, balance, status, payment history)
+2. Accounts (creditor name, account number exactly as printed, balance, status, payment history, date opened, date of first delinquency if shown, and the bureau that reported it; on reports covering several bureaus, list each bureau's copy of an account separately)
 3. Inquiries (company name, date)
 4. Public Records (bankruptcies, collections, judgments)
 5. Negative Items (late payments, charge-offs, etc.)
 
 Credit Report Text:
-{raw_text[:15000]}  
+{report_text}  
 
 Return ONLY valid JSON with this structure:
 {{
   "personal_info": {{"name": "", "addresses": [], "ssn_last4": "", "dob": ""}},
-  "accounts": [{{"creditor": "", "account_num": "", "balance": 0, "status": "", "payment_history": ""}}],
+  "accounts": [{{"creditor": "", "account_num": "", "balance": 0, "status": "", "payment_history": "", "date_opened": "", "date_of_first_delinquency": "", "bureau": ""}}],
   "inquiries": [{{"company": "", "date": ""}}],
   "public_records": [{{"type": "", "status": "", "date": ""}}],
   "negative_items": [{{"description": "", "date": ""}}]
 }}"""
 
+# Reports longer than one chunk are parsed in section-aligned chunks, this many at a time
+PARSE_MAX_CONCURRENCY = 4
+
+# Changes whenever the prompt, model or chunking changes, which invalidates cached parses
+PARSE_PROMPT_VERSION = hashlib.sha256(
+    f"{PARSE_MODEL}\n{report_chunking.CHUNK_CHARS}\n{PARSE_PROMPT_TEMPLATE}".encode("utf-8")
+).hexdigest()[:16]
+
+def _request_structured_report(report_text, client):
+    """Send one piece of report text to the model; returns a dict or None"""
+    prompt = PARSE_PROMPT_TEMPLATE.format(report_text=report_text)
+
     message = client.messages.create(
-        model="claude-sonnet-4-20250514",
+        model=PARSE_MODEL,
         max_tokens=4000,
         messages=[{"role": "user", "content": prompt}]
     )
@@ -265,25 +294,32 @@ Return ONLY valid JSON with this structure:
         response_text = response_text.replace("```json", "").replace("```", "").strip()
         return json.loads(response_text)
     except:
-        # Return basic structure if parsing fails
-        return {
-            "personal_info": {"name": "Unable to parse", "addresses": [], "ssn_last4": "", "dob": ""},
-            "accounts": [],
-            "inquiries": [],
-            "public_records": [],
-            "negative_items": []
-        }
-
-def analyze_for_errors(credit_data, client):
-    """Analyze credit report for errors and FCRA violations"""
+        return None
+
+def get_preparsed_report(raw_text):
+    """Structured report available without a model call (local parser or cache), or None"""
+    # Recognized bureau layouts are parsed locally
+    local_data = bureau_parsers.parse_known_layout(raw_text)
+    if local_data is not None:
+        return local_data
+    return report_cache.get_parsed_report(raw_text, PARSE_PROMPT_VERSION)
+
+def request_error_analysis(credit_data, rule_errors, client):
+    """Ask the model for errors in (part of) a report; returns only the model's errors, or None if unreadable"""
+    already_flagged = ""
+    if rule_errors:
+        already_flagged = "\nAlready flagged (do not repeat): " + "; ".join(
+            f"{e['category']} - {e['affected_item']}" for e in rule_errors
+        ) + "\n"
+
     prompt = f"""You are a credit repair specialist. Analyze this credit report data for errors and FCRA violations.
 
 Credit Report Data:
-{json.dumps(credit_data, indent=2)}
-
+{json.dumps(credit_data, separators=(",", ":"))}
+{already_flagged}
 Identify:
 1. Personal information errors (wrong name, address, SSN, DOB)
-2. Duplicate accounts (same debt listed multiple times)
+2. Duplicate accounts (same debt listed more than once by the same bureau; one copy per bureau on a combined report is normal)
 3. Accounts that may not belong to the user
 4. Incorrect balances or limits
 5. Obsolete information (debts older than 7 years, bankruptcies older than 10 years)
@@ -323,66 +359,68 @@ Return ONLY valid JSON."""
         result = json.loads(response_text)
         return result.get("errors", [])
     except:
-        return []
-
-def generate_dispute_letter(error, user_info, bureau_name, client):
-    """Generate a personalized dispute letter"""
-    prompt = f"""Generate a professional credit dispute letter for the following error:
-
-Error Details:
-{json.dumps(error, indent=2)}
-
-User Information:
-Name: {user_info.get('name', 'John Doe')}
-Address: {user_info.get('address', '123 Main St, City, ST 12345')}
-SSN Last 4: {user_info.get('ssn_last4', 'XXXX')}
-DOB: {user_info.get('dob', 'MM/DD/YYYY')}
-
-Bureau: {bureau_name}
-
-Generate a complete dispute letter that:
-1. Uses proper business letter format
-2. Cites specific FCRA sections (particularly Section 611 and 1681e(b))
-3. Clearly describes the error
-4. Requests investigation within 30 days
-5. Demands correction or deletion
-6. Maintains professional, assertive tone
-7. Mentions sending via certified mail
-8. Requests written confirmation
-
-Return the complete letter text."""
+        return None
 
-    message = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=2000,
-        messages=[{"role": "user", "content": prompt}]
+def write_dispute_paragraph(error, client, placeholder=None, wrap=None, standard_wording=True):
+    """The error-specific paragraph of a dispute letter, the same for every bureau.
+
+    The model is skipped for standard categories when standard_wording is set;
+    otherwise its text streams into placeholder, passed through wrap, if given.
+    """
+    paragraph = letter_templates.standard_paragraph(error) if standard_wording else None
+    if paragraph is None:
+        prompt = letter_templates.PARAGRAPH_PROMPT.format(error=json.dumps(error, separators=(",", ":")))
+        paragraph = ai_streaming.stream_text(
+            client,
+            placeholder,
+            as_text=True,
+            wrap=wrap,
+            model="claude-sonnet-4-20250514",
+            max_tokens=400,
+            messages=[{"role": "user", "content": prompt}]
+        )
+    return paragraph
+
+def generate_dispute_letter(error, user_info, bureau_name, client, placeholder=None, standard_wording=True):
+    """Generate a personalized dispute letter, streaming it into placeholder if given.
+
+    The letter is rendered from a local template; the model only writes the
+    error-specific paragraph.
+    """
+    paragraph = write_dispute_paragraph(
+        error, client, placeholder,
+        wrap=lambda partial: letter_templates.render_letter(error, user_info, bureau_name, partial),
+        standard_wording=standard_wording
     )
-    
-    return message.content[0].text
+    return letter_templates.render_letter(error, user_info, bureau_name, paragraph)
 
 def create_letter_docx(letter_text, filename="dispute_letter.docx"):
-    """Create a downloadable Word document"""
-    doc = Document()
-    
-    # Set margins
-    sections = doc.sections
-    for section in sections:
-        section.top_margin = Inches(1)
-        section.bottom_margin = Inches(1)
-        section.left_margin = Inches(1)
-        section.right_margin = Inches(1)
-    
-    # Add content
-    for line in letter_text.split('\n'):
-        p = doc.add_paragraph(line)
-        p.style.font.size = Pt(12)
-        p.style.font.name = 'Times New Roman'
-    
-    # Save to BytesIO
-    buffer = BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-    return buffer
+    """Create a downloadable Word document (bytes, cached by content)"""
+    return document_builder.build_docx(letter_text)
+
+def create_letter_pdf(letter_text):
+    """Create a downloadable PDF (bytes, cached by content)"""
+    return document_builder.build_pdf(letter_text)
+
+def show_document_downloads(text, file_stem, label):
+    """Word and PDF download buttons side by side"""
+    col_docx, col_pdf = st.columns(2)
+    with col_docx:
+        st.download_button(
+            label=f"📥 {label} as Word Document",
+            data=create_letter_docx(text),
+            file_name=f"{file_stem}.docx",
+            mime=document_builder.DOCX_MIME,
+            use_container_width=True
+        )
+    with col_pdf:
+        st.download_button(
+            label=f"📄 {label} as PDF",
+            data=create_letter_pdf(text),
+            file_name=f"{file_stem}.pdf",
+            mime=document_builder.PDF_MIME,
+            use_container_width=True
+        )
 
 def get_logo_base64():
     """Convert logo to base64 for embedding in HTML"""
@@ -393,8 +431,8 @@ def get_logo_base64():
     except:
         return ""
 
-def generate_credit_plan(credit_data, errors, client):
-    """Generate a personalized 90-day credit building plan"""
+def generate_credit_plan(credit_data, errors, client, placeholder=None):
+    """Generate a personalized 90-day credit building plan, streaming it into placeholder if given"""
     prompt = f"""Create a personalized 90-day credit building action plan based on this credit profile:
 
 Credit Data Summary:
@@ -414,13 +452,13 @@ Create a practical, actionable 90-day plan with:
 Include specific weekly action items, tips for credit mix, and budget recommendations.
 Format it clearly with headers and bullet points."""
 
-    message = client.messages.create(
+    return ai_streaming.stream_text(
+        client,
+        placeholder,
         model="claude-sonnet-4-20250514",
         max_tokens=3000,
         messages=[{"role": "user", "content": prompt}]
     )
-    
-    return message.content[0].text
 
 # Main App UI
 def main():
@@ -560,8 +598,9 @@ def main():
         uploaded_file = st.file_uploader("Choose your credit report PDF", type=['pdf'])
         
         if uploaded_file is not None:
-            with st.spinner("📖 Reading PDF..."):
-                raw_text = extract_text_from_pdf(uploaded_file)
+            read_progress = st.progress(0.0, text="📖 Reading PDF...")
+            raw_text = extract_text_from_pdf(uploaded_file, read_progress)
+            read_progress.empty()
             
             if raw_text:
                 st.success("[OK] PDF loaded successfully!")
@@ -588,23 +627,52 @@ def main():
                     
                     client = get_anthropic_client()
                     
-                    # Parse the report
-                    with st.spinner("🤖 AI is structuring your credit report data..."):
-                        credit_data = parse_credit_report_with_ai(raw_text, client)
-                        st.session_state.credit_data = credit_data
+                    # Parse and analyze together: each section is checked as soon as it is structured
+                    parse_status = st.empty()
+                    findings = st.empty()
+                    parse_status.info("🤖 AI is structuring your credit report data...")
+                    found_so_far = []
+                    credit_data, errors, fully_parsed_by_ai = None, [], False
+                    failed_chunks, failed_analyses, chunk_count = 0, 0, 1
+                    for event in analysis_pipeline.run_analysis(
+                        raw_text,
+                        parse_chunk=lambda chunk: _request_structured_report(chunk, client),
+                        analyze_section=lambda section_data, flagged: request_error_analysis(section_data, flagged, client),
+                        preparsed=get_preparsed_report(raw_text),
+                        max_workers=PARSE_MAX_CONCURRENCY
+                    ):
+                        if event[0] == "parsed":
+                            _, parsed_count, chunk_count, _ = event
+                            parse_status.info(f"🔍 Structured {parsed_count} of {chunk_count} report section(s), analyzing for errors and FCRA violations...")
+                        elif event[0] == "errors":
+                            found_so_far.extend(event[1])
+                            categories = sorted({e.get('category', 'Error') for e in found_so_far})
+                            findings.markdown(f"**{len(found_so_far)} potential issue(s) so far:** {', '.join(categories)}")
+                        else:
+                            _, credit_data, errors, fully_parsed_by_ai, failed_chunks, failed_analyses = event
+                    findings.empty()
                     
-                    st.success("✅ Report structured!")
+                    if failed_chunks == chunk_count:
+                        # Nothing was structured, so nothing was analyzed: don't use up an analysis
+                        parse_status.error("❌ We couldn't read this report. Please try again in a few minutes, or upload a different PDF.")
+                        st.stop()
+                    
+                    # Only complete parses are cached; a failed chunk is retried next time
+                    if fully_parsed_by_ai:
+                        report_cache.put_parsed_report(raw_text, PARSE_PROMPT_VERSION, credit_data)
+                    st.session_state.credit_data = credit_data
+                    st.session_state.errors_found = errors
+                    st.session_state.analysis_complete = True
+                    
+                    if failed_chunks or failed_analyses:
+                        parse_status.warning("⚠️ Parts of your report couldn't be read or checked, so some issues may be missing. Re-run the analysis to fill the gaps.")
+                    else:
+                        parse_status.success("✅ Report structured!")
                     
                     # Show parsed data
                     with st.expander("📊 Structured Credit Data"):
                         st.json(credit_data)
                     
-                    # Analyze for errors
-                    with st.spinner("🔍 Analyzing for errors and FCRA violations..."):
-                        errors = analyze_for_errors(credit_data, client)
-                        st.session_state.errors_found = errors
-                        st.session_state.analysis_complete = True
-                    
                     # RECORD THE ANALYSIS
                     auth.record_analysis(user_id, uploaded_file.name, len(errors))
                     
@@ -676,6 +744,12 @@ def main():
             with st.expander("📋 Error Details"):
                 st.json(selected_error)
             
+            standard_wording = st.checkbox(
+                "⚡ Use standard wording for common errors (instant, no AI)",
+                value=True,
+                help="Duplicate accounts, obsolete items, small medical debts and unrecognized inquiries use a stock paragraph."
+            )
+            
             # Generate letter button
             if st.button("✍️ Generate Dispute Letter", type="primary", use_container_width=True):
                 if not st.session_state.user_info.get('name'):
@@ -683,27 +757,29 @@ def main():
                 else:
                     client = get_anthropic_client()
                     
-                    with st.spinner("✍️ AI is writing your dispute letter..."):
-                        letter_text = generate_dispute_letter(
-                            selected_error,
-                            st.session_state.user_info,
-                            bureau,
-                            client
-                        )
+                    letter_status = st.empty()
+                    letter_status.caption("✍️ AI is writing your dispute letter...")
+                    letter_preview = st.empty()
+                    letter_text = generate_dispute_letter(
+                        selected_error,
+                        st.session_state.user_info,
+                        bureau,
+                        client,
+                        placeholder=letter_preview,
+                        standard_wording=standard_wording
+                    )
+                    letter_preview.empty()
                     
-                    st.success("[OK] Letter generated!")
+                    letter_status.success("[OK] Letter generated!")
                     
                     # Display letter
                     st.text_area("Your Dispute Letter", letter_text, height=400)
                     
-                    # Download button
-                    doc_buffer = create_letter_docx(letter_text)
-                    st.download_button(
-                        label="📥 Download as Word Document",
-                        data=doc_buffer,
-                        file_name=f"dispute_letter_{bureau}_{datetime.now().strftime('%Y%m%d')}.docx",
-                        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                        use_container_width=True
+                    # Download buttons
+                    show_document_downloads(
+                        letter_text,
+                        f"dispute_letter_{bureau}_{datetime.now().strftime('%Y%m%d')}",
+                        "Download"
                     )
                     
                     st.divider()
@@ -716,6 +792,44 @@ def main():
                     5. Keep copies of everything
                     6. Bureau has 30 days to investigate
                     """)
+            
+            # Batch mode: every error to every bureau in one go
+            st.divider()
+            st.subheader("📦 Generate All Letters")
+            error_count = len(st.session_state.errors_found)
+            st.caption(f"Writes {error_count * len(dispute_batch.BUREAUS)} letters ({error_count} errors × {len(dispute_batch.BUREAUS)} bureaus) and packages them into one ZIP.")
+            if st.button("📦 Generate All Letters", use_container_width=True):
+                if not st.session_state.user_info.get('name'):
+                    st.warning("Please fill in your information in the sidebar first")
+                else:
+                    client = get_anthropic_client()
+                    batch_progress = st.progress(0.0, text="✍️ Writing letters...")
+                    letters = dispute_batch.generate_all(
+                        st.session_state.errors_found,
+                        st.session_state.user_info,
+                        lambda error: write_dispute_paragraph(error, client, standard_wording=standard_wording),
+                        on_progress=lambda done, total: batch_progress.progress(done / total, text=f"✍️ Wrote {done} of {total} letters...")
+                    )
+                    batch_progress.empty()
+                    written = [l for l in letters if l['letter_text']]
+                    auth.save_dispute_letters(
+                        st.session_state.user['id'],
+                        [(l['bureau'], l['error'].get('description', ''), l['letter_text']) for l in written]
+                    )
+                    st.session_state.batch_letters_zip = dispute_batch.build_zip(written, create_letter_docx)
+                    st.session_state.batch_letters_count = len(written)
+                    failed = len(letters) - len(written)
+                    if failed:
+                        st.warning(f"⚠️ {failed} letter(s) could not be generated. Try again to retry them.")
+            if st.session_state.get('batch_letters_zip'):
+                st.success(f"[OK] {st.session_state.batch_letters_count} letters ready!")
+                st.download_button(
+                    label="📥 Download All Letters (ZIP)",
+                    data=st.session_state.batch_letters_zip,
+                    file_name=f"dispute_letters_{datetime.now().strftime('%Y%m%d')}.zip",
+                    mime="application/zip",
+                    use_container_width=True
+                )
     
     with tab3:
         st.header("📈 Your Credit Building Plan")
@@ -726,24 +840,23 @@ def main():
             if st.button("🚀 Generate My 90-Day Action Plan", type="primary", use_container_width=True):
                 client = get_anthropic_client()
                 
-                with st.spinner("🤖 AI is creating your personalized credit plan..."):
-                    plan = generate_credit_plan(
-                        st.session_state.credit_data,
-                        st.session_state.errors_found,
-                        client
-                    )
+                plan_status = st.empty()
+                plan_status.caption("🤖 AI is creating your personalized credit plan...")
+                plan_output = st.empty()
+                plan = generate_credit_plan(
+                    st.session_state.credit_data,
+                    st.session_state.errors_found,
+                    client,
+                    placeholder=plan_output
+                )
           
-                st.success("[OK] Your plan is ready!")
-                st.markdown(plan)
+                plan_status.success("[OK] Your plan is ready!")
                 
                 # Download plan
-                plan_buffer = create_letter_docx(plan, "credit_building_plan.docx")
-                st.download_button(
-                    label="📥 Download Plan as Word Document",
-                    data=plan_buffer,
-                    file_name=f"credit_plan_{datetime.now().strftime('%Y%m%d')}.docx",
-                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                    use_container_width=True
+                show_document_downloads(
+                    plan,
+                    f"credit_plan_{datetime.now().strftime('%Y%m%d')}",
+                    "Download Plan"
                 )
                 
     with tab4:
@@ -753,8 +866,7 @@ def main():
     with tab5:
         st.header("📊 Credit Score Tracker")
 
-        user_plan = (st.session_state.get("user") or {}).get("plan", "free")
-        is_paid = user_plan in ("basic", "pro", "premium")
+        is_paid = "score_tracker" in entitlements.current()["features"]
 
         if not is_paid:
             st.info("🔒 Upgrade to track and monitor your credit scores over time.")
@@ -764,21 +876,6 @@ def main():
                 st.rerun()
             st.stop()
 
-        import sqlite3
-        conn = sqlite3.connect(auth.DB_PATH)
-        c = conn.cursor()
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS score_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                bureau TEXT,
-                score INTEGER,
-                note TEXT,
-                logged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
-
         # --- Log New Score ---
         with st.expander("➕ Log New Score", expanded=True):
             col1, col2, col3 = st.columns(3)
@@ -800,17 +897,17 @@ def main():
             st.markdown(f"<div style='background:{sc}20;border-left:4px solid {sc};padding:0.5rem 1rem;border-radius:6px;'><strong style='color:{sc};font-size:1.2rem;'>{score}</strong> <span style='color:#666;'>— {sl}</span></div>", unsafe_allow_html=True)
 
             if st.button("💾 Save Score", type="primary", use_container_width=True):
-                c.execute("INSERT INTO score_history (user_id, bureau, score, note) VALUES (?, ?, ?, ?)",
-                          (st.session_state.user["id"], bureau, score, note))
-                conn.commit()
+                with db.transaction() as conn:
+                    conn.execute("INSERT INTO score_history (user_id, bureau, score, note) VALUES (?, ?, ?, ?)",
+                                 (st.session_state.user["id"], bureau, score, note))
+                auth.invalidate_user_stats(st.session_state.user["id"])
                 st.success(f"✅ {bureau} score of {score} saved!")
                 st.rerun()
 
         # --- Fetch all scores ---
-        c.execute("SELECT bureau, score, note, logged_at FROM score_history WHERE user_id = ? ORDER BY logged_at ASC",
-                  (st.session_state.user["id"],))
-        rows = c.fetchall()
-        conn.close()
+        with db.transaction() as conn:
+            rows = conn.execute("SELECT bureau, score, note, logged_at FROM score_history WHERE user_id = ? ORDER BY logged_at ASC",
+                                (st.session_state.user["id"],)).fetchall()
 
         if not rows:
             st.info("👆 Log your first score above to start tracking!")
@@ -924,8 +1021,7 @@ def main():
     with tab6:
         st.header("📅 Dispute Tracker & Tools")
 
-        user_plan_t6 = (st.session_state.get("user") or {}).get("plan", "free")
-        is_paid_t6 = user_plan_t6 in ("basic", "pro", "premium")
+        is_paid_t6 = "dispute_tracker" in entitlements.current()["features"]
 
         if not is_paid_t6:
             st.markdown("""
@@ -945,35 +1041,19 @@ def main():
                 st.session_state.upgrade_source = "dispute_tracker"
                 st.rerun()
         else:
-            import sqlite3
             import smtplib
             import ssl
             from email.mime.text import MIMEText
             from email.mime.multipart import MIMEMultipart
 
-            conn = sqlite3.connect(auth.DB_PATH)
-            c = conn.cursor()
-            c.execute("""
-                CREATE TABLE IF NOT EXISTS dispute_reminders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    bureau TEXT,
-                    dispute_description TEXT,
-                    sent_date TEXT,
-                    follow_up_date TEXT,
-                    status TEXT DEFAULT 'pending'
-                )
-            """)
-            conn.commit()
-
             dtab1, dtab2, dtab3 = st.tabs(["📋 My Disputes", "➕ Add Dispute", "📬 Email a Letter"])
 
             with dtab1:
-                c.execute(
-                    "SELECT id, bureau, dispute_description, sent_date, follow_up_date, status FROM dispute_reminders WHERE user_id = ? ORDER BY follow_up_date ASC",
-                    (st.session_state.user["id"],)
-                )
-                rows = c.fetchall()
+                with db.transaction() as conn:
+                    rows = conn.execute(
+                        "SELECT id, bureau, dispute_description, sent_date, follow_up_date, status FROM dispute_reminders WHERE user_id = ? ORDER BY follow_up_date ASC",
+                        (st.session_state.user["id"],)
+                    ).fetchall()
 
                 if not rows:
                     st.info("No disputes tracked yet. Use the **Add Dispute** tab to get started!")
@@ -1023,17 +1103,15 @@ def main():
                             col1, col2 = st.columns(2)
                             with col1:
                                 if st.button("✅ Resolved", key=f"resolve_{rid}", use_container_width=True):
-                                    conn2 = sqlite3.connect(auth.DB_PATH)
-                                    conn2.execute("UPDATE dispute_reminders SET status = 'resolved' WHERE id = ?", (rid,))
-                                    conn2.commit()
-                                    conn2.close()
+                                    with db.transaction() as conn2:
+                                        conn2.execute("UPDATE dispute_reminders SET status = 'resolved' WHERE id = ?", (rid,))
+                                    auth.invalidate_user_stats(st.session_state.user["id"])
                                     st.rerun()
                             with col2:
                                 if st.button("🗑️ Delete", key=f"delete_{rid}", use_container_width=True):
-                                    conn2 = sqlite3.connect(auth.DB_PATH)
-                                    conn2.execute("DELETE FROM dispute_reminders WHERE id = ?", (rid,))
-                                    conn2.commit()
-                                    conn2.close()
+                                    with db.transaction() as conn2:
+                                        conn2.execute("DELETE FROM dispute_reminders WHERE id = ?", (rid,))
+                                    auth.invalidate_user_stats(st.session_state.user["id"])
                                     st.rerun()
 
                     if overdue:
@@ -1061,11 +1139,12 @@ def main():
                 st.caption("💡 Bureaus have 30 days to respond. We recommend following up at day 35.")
                 if st.button("💾 Save Dispute", type="primary", use_container_width=True):
                     if description:
-                        c.execute(
-                            "INSERT INTO dispute_reminders (user_id, bureau, dispute_description, sent_date, follow_up_date) VALUES (?, ?, ?, ?, ?)",
-                            (st.session_state.user["id"], bureau_d, description, str(sent_date), str(follow_up))
-                        )
-                        conn.commit()
+                        with db.transaction() as conn:
+                            conn.execute(
+                                "INSERT INTO dispute_reminders (user_id, bureau, dispute_description, sent_date, follow_up_date) VALUES (?, ?, ?, ?, ?)",
+                                (st.session_state.user["id"], bureau_d, description, str(sent_date), str(follow_up))
+                            )
+                        auth.invalidate_user_stats(st.session_state.user["id"])
                         st.success("✅ Dispute saved!")
                         st.rerun()
                     else:
@@ -1091,8 +1170,10 @@ def main():
                             st.warning("Please fill in your personal info in the sidebar first.")
                         else:
                             client = get_anthropic_client()
-                            with st.spinner("✍️ Generating..."):
-                                letter = generate_dispute_letter(selected_error, st.session_state.user_info, bureau_e, client)
+                            letter_preview = st.empty()
+                            letter = generate_dispute_letter(selected_error, st.session_state.user_info, bureau_e, client,
+                                                             placeholder=letter_preview)
+                            letter_preview.empty()
                             st.session_state.email_letter = letter
                             st.session_state.email_bureau_name = bureau_e
                             st.success("✅ Letter ready!")
@@ -1138,18 +1219,19 @@ def main():
                                 if success_count > 0:
                                     today_str = datetime.now().strftime("%Y-%m-%d")
                                     followup_str = (datetime.now() + timedelta(days=35)).strftime("%Y-%m-%d")
-                                    c.execute("INSERT INTO dispute_reminders (user_id, bureau, dispute_description, sent_date, follow_up_date) VALUES (?, ?, ?, ?, ?)",
-                                              (st.session_state.user["id"], bureau_name, selected_error.get('description', 'Dispute'), today_str, followup_str))
-                                    conn.commit()
+                                    with db.transaction() as conn:
+                                        conn.execute("INSERT INTO dispute_reminders (user_id, bureau, dispute_description, sent_date, follow_up_date) VALUES (?, ?, ?, ?, ?)",
+                                                     (st.session_state.user["id"], bureau_name, selected_error.get('description', 'Dispute'), today_str, followup_str))
+                                    auth.invalidate_user_stats(st.session_state.user["id"])
                                     st.info(f"🔔 Follow-up reminder set for {followup_str}")
-            conn.close()
 
     with tab7:
         st.header("🤖 AI Credit Coach")
         st.caption("Your personalized AI coach — daily action steps, progress insights, and smart credit guidance.")
 
-        user_plan_t7 = (st.session_state.get("user") or {}).get("plan", "free")
-        is_paid_t7 = user_plan_t7 in ("basic", "pro", "premium")
+        entitlements_t7 = entitlements.current()
+        user_plan_t7 = entitlements_t7["plan"]
+        is_paid_t7 = "credit_coach" in entitlements_t7["features"]
 
         if not is_paid_t7:
             st.markdown("""
@@ -1187,20 +1269,20 @@ def main():
                 else:
                     if st.button("🤖 Generate My Action Plan", type="primary", use_container_width=True):
                         client = get_anthropic_client()
-                        with st.spinner("🤖 Building your plan..."):
-                            prompt = f"""You are an expert credit coach. Create a detailed 30-day credit improvement plan.
+                        prompt = f"""You are an expert credit coach. Create a detailed 30-day credit improvement plan.
 Credit Profile: Accounts: {len(credit_data.get('accounts', []))}, Negatives: {len(credit_data.get('negative_items', []))}, Errors: {len(errors)}, Top Issues: {", ".join([e.get('category','') for e in errors[:3]])}
 Create week-by-week plan: Week 1 immediate actions, Week 2 momentum, Week 3 optimization, Week 4 review.
 Be specific, actionable, encouraging. Use clear headers and bullet points."""
-                            response = client.messages.create(model="claude-3-5-sonnet-latest", max_tokens=2000, messages=[{"role": "user", "content": prompt}])
-                            st.session_state.coach_plan = response.content[0].text
+                        coach_output = st.empty()
+                        st.session_state.coach_plan = ai_streaming.stream_text(
+                            client, coach_output, model="claude-3-5-sonnet-latest", max_tokens=2000,
+                            messages=[{"role": "user", "content": prompt}])
+                        coach_output.empty()
                     if st.session_state.get('coach_plan'):
                         st.markdown(st.session_state.coach_plan)
-                        plan_buffer = create_letter_docx(st.session_state.coach_plan)
-                        st.download_button("📥 Download Action Plan", data=plan_buffer,
-                                           file_name=f"credit_action_plan_{datetime.now().strftime('%Y%m%d')}.docx",
-                                           mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                                           use_container_width=True)
+                        show_document_downloads(st.session_state.coach_plan,
+                                                f"credit_action_plan_{datetime.now().strftime('%Y%m%d')}",
+                                                "Download Action Plan")
 
             with coach_tab2:
                 st.subheader("🎯 Today's Focus")
@@ -1209,13 +1291,15 @@ Be specific, actionable, encouraging. Use clear headers and bullet points."""
                 else:
                     if st.button("🔄 Get Today's Action", type="primary", use_container_width=True):
                         client = get_anthropic_client()
-                        with st.spinner("🤖 Getting your daily focus..."):
-                            top_error = errors[0] if errors else None
-                            prompt = f"""Credit coach: Give ONE specific actionable task for today.
+                        top_error = errors[0] if errors else None
+                        prompt = f"""Credit coach: Give ONE specific actionable task for today.
 Top issue: {top_error.get('category', 'N/A') if top_error else 'None'} - {top_error.get('description', '') if top_error else ''}
 Give: 1) Today's action (specific), 2) Why it matters, 3) How to do it (steps), 4) Time required, 5) Expected impact. One task only."""
-                            response = client.messages.create(model="claude-3-5-sonnet-latest", max_tokens=600, messages=[{"role": "user", "content": prompt}])
-                            st.session_state.todays_focus = response.content[0].text
+                        focus_output = st.empty()
+                        st.session_state.todays_focus = ai_streaming.stream_text(
+                            client, focus_output, model="claude-3-5-sonnet-latest", max_tokens=600,
+                            messages=[{"role": "user", "content": prompt}])
+                        focus_output.empty()
                     if st.session_state.get('todays_focus'):
                         st.markdown(st.session_state.todays_focus)
                         if st.button("✅ Mark as Done", type="primary"):
@@ -1225,16 +1309,10 @@ Give: 1) Today's action (specific), 2) Why it matters, 3) How to do it (steps),
 
             with coach_tab3:
                 st.subheader("📊 Progress Check")
-                import sqlite3 as _sqlite3
-                conn3 = _sqlite3.connect(auth.DB_PATH)
-                c3 = conn3.cursor()
-                c3.execute("SELECT COUNT(*) FROM score_history WHERE user_id = ?", (st.session_state.user["id"],))
-                score_count = c3.fetchone()[0]
-                c3.execute("SELECT COUNT(*) FROM dispute_reminders WHERE user_id = ?", (st.session_state.user["id"],))
-                dispute_count = c3.fetchone()[0]
-                c3.execute("SELECT COUNT(*) FROM dispute_reminders WHERE user_id = ? AND status = 'resolved'", (st.session_state.user["id"],))
-                resolved_count = c3.fetchone()[0]
-                conn3.close()
+                progress = auth.get_user_stats(st.session_state.user["id"])
+                score_count = progress['scores_logged']
+                dispute_count = progress['disputes_tracked']
+                resolved_count = progress['disputes_resolved']
 
                 p1, p2, p3, p4 = st.columns(4)
                 p1.metric("Scores Logged", score_count)
@@ -1246,12 +1324,12 @@ Give: 1) Today's action (specific), 2) Why it matters, 3) How to do it (steps),
                 if score_count > 0 or dispute_count > 0:
                     if st.button("🤖 Get Progress Analysis", type="primary", use_container_width=True):
                         client = get_anthropic_client()
-                        with st.spinner("Analyzing your progress..."):
-                            prompt = f"""Credit coach: Give encouraging progress report.
+                        prompt = f"""Credit coach: Give encouraging progress report.
 Stats: Scores logged: {score_count}, Disputes filed: {dispute_count}, Resolved: {resolved_count}, Errors identified: {len(errors) if has_report else 0}
 Give: 1) Progress assessment, 2) What's working, 3) Next priority, 4) Encouragement. Personal and uplifting."""
-                            response = client.messages.create(model="claude-3-5-sonnet-latest", max_tokens=600, messages=[{"role": "user", "content": prompt}])
-                            st.markdown(response.content[0].text)
+                        ai_streaming.stream_text(
+                            client, st.empty(), model="claude-3-5-sonnet-latest", max_tokens=600,
+                            messages=[{"role": "user", "content": prompt}])
                 else:
                     st.info("Start logging scores and filing disputes to see your progress analysis here!")
 
@@ -4,84 +4,93 @@ Uses SQLite on Render Persistent Disk
 """
 
 import streamlit as st
-import sqlite3
-import hashlib
-import secrets
-from datetime import datetime
 import os
+import time
+import threading
+from datetime import datetime
+import db
+import entitlements
+import password_hashing
+import rate_limiter
 
 # Persistent disk path on Render
-DB_PATH = "/opt/render/project/src/data/users.db"
+DB_PATH = db.DB_PATH
+
+# Proxies in front of the app that append to X-Forwarded-For (Render's load balancer)
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
 
-# Make sure the data directory exists
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+# Seconds a user's stats are served from memory; writes below invalidate explicitly
+STATS_TTL_SECONDS = 30
 
-def init_database():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        email TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        plan TEXT DEFAULT 'free',
-        reports_analyzed INTEGER DEFAULT 0,
-        disputes_purchased INTEGER DEFAULT 0
-    )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS analysis_history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        report_name TEXT,
-        errors_found INTEGER,
-        analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )''')
-    c.execute('''CREATE TABLE IF NOT EXISTS dispute_letters (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        bureau TEXT,
-        error_description TEXT,
-        status TEXT DEFAULT 'draft',
-        purchased BOOLEAN DEFAULT 0,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users (id)
-    )''')
-    conn.commit()
-    conn.close()
+_stats_cache = {}
+_stats_lock = threading.Lock()
 
 def hash_password(password: str) -> str:
-    salt = secrets.token_hex(16)
-    pwd_hash = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), 100000)
-    return salt + pwd_hash.hex()
+    return password_hashing.hash_password(password)
 
 def verify_password(password: str, password_hash: str) -> bool:
-    salt = password_hash[:32]
-    stored_hash = password_hash[32:]
-    pwd_hash = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), 100000)
-    return pwd_hash.hex() == stored_hash
+    return password_hashing.verify_password(password, password_hash)
 
 def create_user(email: str, password: str) -> tuple:
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
         password_hash = hash_password(password)
-        c.execute('INSERT INTO users (email, password_hash) VALUES (?, ?)', (email, password_hash))
-        conn.commit()
-        conn.close()
+        with db.transaction() as conn:
+            conn.execute('INSERT INTO users (email, password_hash) VALUES (?, ?)', (email, password_hash))
         return True, "Account created successfully!"
-    except sqlite3.IntegrityError:
+    except db.IntegrityError:
         return False, "Email already exists"
     except Exception as e:
         return False, f"Error: {str(e)}"
 
-def authenticate_user(email: str, password: str) -> tuple:
+def forwarded_client(forwarded: str, trusted_hops: int = None) -> str:
+    """The client address our own proxies recorded in X-Forwarded-For.
+
+    Clients can send any X-Forwarded-For they like; each proxy appends the
+    address it saw, so only the last trusted_hops entries are reliable.
+    """
+    trusted_hops = TRUSTED_PROXY_HOPS if trusted_hops is None else trusted_hops
+    entries = [entry.strip() for entry in forwarded.split(",") if entry.strip()]
+    if not entries:
+        return ""
+    return entries[-min(trusted_hops, len(entries))]
+
+def client_address() -> str:
+    """Best-effort address of the browser behind this session"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute('SELECT id, email, password_hash, plan, reports_analyzed, disputes_purchased FROM users WHERE email = ?', (email,))
-        user = c.fetchone()
-        conn.close()
-        if user and verify_password(password, user[2]):
+        from streamlit.web.server.websocket_headers import _get_websocket_headers
+        forwarded = forwarded_client((_get_websocket_headers() or {}).get("X-Forwarded-For", ""))
+        if forwarded:
+            return forwarded
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        return f"session:{get_script_run_ctx().session_id}"
+    except Exception:
+        return "unknown"
+
+def authenticate_user(email: str, password: str, client: str = None) -> tuple:
+    allowed, retry_after = rate_limiter.check_login(email, client or client_address())
+    if not allowed:
+        return False, {'error': f"Too many sign-in attempts. Please try again in {int(retry_after) + 1} seconds."}
+    try:
+        with db.transaction() as conn:
+            c = conn.cursor()
+            c.execute('SELECT id, email, password_hash, plan, reports_analyzed, disputes_purchased FROM users WHERE email = ?', (email,))
+            user = c.fetchone()
+        stored_hash = user[2] if user else ''
+        if not user or rate_limiter.known_failure(email, password, stored_hash):
+            rate_limiter.record_failure(email, password, stored_hash)
+            return False, {}
+        if verify_password(password, stored_hash):
+            if password_hashing.needs_rehash(user[2]):
+                # Upgrade to the current scheme; skipped if the hash changed meanwhile
+                try:
+                    new_hash = hash_password(password)
+                except password_hashing.HashingBusyError:
+                    new_hash = None  # upgrade on a quieter sign-in
+                if new_hash:
+                    with db.transaction() as conn:
+                        conn.execute('UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                                     (new_hash, user[0], user[2]))
+            rate_limiter.record_success(email)
             return True, {
                 'id': user[0],
                 'email': user[1],
@@ -89,88 +98,128 @@ def authenticate_user(email: str, password: str) -> tuple:
                 'reports_analyzed': user[4],
                 'disputes_purchased': user[5]
             }
+        rate_limiter.record_failure(email, password, stored_hash)
         return False, {}
+    except password_hashing.HashingBusyError:
+        return False, {'error': "Sign-in is busy right now. Please try again in a few seconds."}
     except Exception as e:
         return False, {}
 
 def get_user_stats(user_id: int) -> dict:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT COUNT(*) FROM analysis_history WHERE user_id = ?', (user_id,))
-    analyses = c.fetchone()[0]
-    c.execute('SELECT COUNT(*) FROM dispute_letters WHERE user_id = ? AND purchased = 1', (user_id,))
-    disputes = c.fetchone()[0]
-    c.execute('SELECT plan, reports_analyzed, disputes_purchased FROM users WHERE id = ?', (user_id,))
-    user_data = c.fetchone()
-    conn.close()
-    return {
-        'total_analyses': analyses,
-        'total_disputes': disputes,
-        'plan': user_data[0],
-        'reports_analyzed': user_data[1],
-        'disputes_purchased': user_data[2]
+    """Usage counters for the dashboard, plan gates and coach, in one indexed query"""
+    now = time.monotonic()
+    with _stats_lock:
+        cached = _stats_cache.get(user_id)
+        if cached and cached[0] > now:
+            return dict(cached[1])
+    with db.transaction() as conn:
+        row = conn.execute('''SELECT u.plan, u.reports_analyzed, u.disputes_purchased,
+                   (SELECT COUNT(*) FROM analysis_history WHERE user_id = u.id),
+                   (SELECT COUNT(*) FROM dispute_letters WHERE user_id = u.id AND purchased = 1),
+                   (SELECT COUNT(*) FROM score_history WHERE user_id = u.id),
+                   (SELECT COUNT(*) FROM dispute_reminders WHERE user_id = u.id),
+                   (SELECT COUNT(*) FROM dispute_reminders WHERE user_id = u.id AND status = 'resolved')
+            FROM users u WHERE u.id = ?''', (user_id,)).fetchone()
+    stats = {
+        'total_analyses': row[3],
+        'total_disputes': row[4],
+        'plan': row[0],
+        'reports_analyzed': row[1],
+        'disputes_purchased': row[2],
+        'scores_logged': row[5],
+        'disputes_tracked': row[6],
+        'disputes_resolved': row[7]
     }
+    with _stats_lock:
+        _stats_cache[user_id] = (now + STATS_TTL_SECONDS, stats)
+    return dict(stats)
+
+def invalidate_user_stats(user_id: int = None):
+    """Drop cached stats for one user, or for everyone when user_id is None"""
+    with _stats_lock:
+        if user_id is None:
+            _stats_cache.clear()
+        else:
+            _stats_cache.pop(user_id, None)
 
 def update_user_plan(user_id: int, plan: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('UPDATE users SET plan = ? WHERE id = ?', (plan, user_id))
-    conn.commit()
-    conn.close()
+    with db.transaction() as conn:
+        conn.execute('UPDATE users SET plan = ? WHERE id = ?', (plan, user_id))
+    invalidate_user_stats(user_id)
+    entitlements.invalidate(user_id)
     if st.session_state.get('user') and st.session_state.user['id'] == user_id:
         st.session_state.user['plan'] = plan
 
-def get_all_users():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT id, email, plan, reports_analyzed, disputes_purchased, created_at FROM users ORDER BY created_at DESC')
-    users = c.fetchall()
-    conn.close()
-    return users
+def _user_filters(email_prefix: str, plan: str) -> tuple:
+    clauses, params = [], []
+    if email_prefix:
+        # A range on the unique email index; LIKE can't use it in SQLite
+        clauses.append('email >= ? AND email < ?')
+        params += [email_prefix, email_prefix + '\uffff']
+    if plan:
+        clauses.append('plan = ?')
+        params.append(plan)
+    return clauses, params
+
+def get_users_page(after_id: int = None, limit: int = 25, email_prefix: str = '', plan: str = None) -> list:
+    """Newest users first, keyset-paginated: pass the last id of the previous page as after_id"""
+    clauses, params = _user_filters(email_prefix, plan)
+    if after_id is not None:
+        clauses.append('id < ?')
+        params.append(after_id)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    with db.transaction() as conn:
+        return conn.execute(f'SELECT id, email, plan, reports_analyzed, disputes_purchased, created_at FROM users {where} '
+                            'ORDER BY id DESC LIMIT ?', params + [limit]).fetchall()
+
+def count_users(email_prefix: str = '', plan: str = None) -> int:
+    clauses, params = _user_filters(email_prefix, plan)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    with db.transaction() as conn:
+        return conn.execute(f'SELECT COUNT(*) FROM users {where}', params).fetchone()[0]
 
 def can_analyze_report(user_id: int) -> tuple:
-    stats = get_user_stats(user_id)
-    if stats['plan'] in ('premium', 'pro', 'basic'):
+    if entitlements.has_feature(user_id, 'unlimited_analyses'):
         return True, "Unlimited analyses"
-    if stats['reports_analyzed'] >= 1:
-        return False, "Free tier limit reached (1 report). Upgrade for unlimited analyses."
-    return True, f"You have {1 - stats['reports_analyzed']} analysis remaining"
+    stats = get_user_stats(user_id)
+    if stats['reports_analyzed'] >= entitlements.FREE_ANALYSES:
+        return False, f"Free tier limit reached ({entitlements.FREE_ANALYSES} report). Upgrade for unlimited analyses."
+    return True, f"You have {entitlements.FREE_ANALYSES - stats['reports_analyzed']} analysis remaining"
 
 def record_analysis(user_id: int, report_name: str, errors_found: int):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('INSERT INTO analysis_history (user_id, report_name, errors_found) VALUES (?, ?, ?)',
-              (user_id, report_name, errors_found))
-    c.execute('UPDATE users SET reports_analyzed = reports_analyzed + 1 WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute('INSERT INTO analysis_history (user_id, report_name, errors_found) VALUES (?, ?, ?)',
+                  (user_id, report_name, errors_found))
+        c.execute('UPDATE users SET reports_analyzed = reports_analyzed + 1 WHERE id = ?', (user_id,))
+    invalidate_user_stats(user_id)
 
-def save_dispute_letter(user_id: int, bureau: str, error_description: str) -> int:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('INSERT INTO dispute_letters (user_id, bureau, error_description) VALUES (?, ?, ?)',
-              (user_id, bureau, error_description))
-    letter_id = c.lastrowid
-    conn.commit()
-    conn.close()
-    return letter_id
+def save_dispute_letter(user_id: int, bureau: str, error_description: str, letter_text: str = None) -> int:
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute('INSERT INTO dispute_letters (user_id, bureau, error_description, letter_text) VALUES (?, ?, ?, ?) RETURNING id',
+                  (user_id, bureau, error_description, letter_text))
+        return c.fetchone()[0]
+
+def save_dispute_letters(user_id: int, letters: list):
+    """Save (bureau, error_description, letter_text) tuples in one transaction"""
+    with db.transaction() as conn:
+        conn.executemany('INSERT INTO dispute_letters (user_id, bureau, error_description, letter_text) VALUES (?, ?, ?, ?)',
+                         [(user_id, bureau, description, text) for bureau, description, text in letters])
 
 def purchase_dispute_letter(user_id: int, letter_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('UPDATE dispute_letters SET purchased = 1, status = ? WHERE id = ? AND user_id = ?',
-              ('ready', letter_id, user_id))
-    c.execute('UPDATE users SET disputes_purchased = disputes_purchased + 1 WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute('UPDATE dispute_letters SET purchased = 1, status = ? WHERE id = ? AND user_id = ?',
+                  ('ready', letter_id, user_id))
+        c.execute('UPDATE users SET disputes_purchased = disputes_purchased + 1 WHERE id = ?', (user_id,))
+    invalidate_user_stats(user_id)
 
 def get_user_disputes(user_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('SELECT id, bureau, error_description, status, purchased, created_at FROM dispute_letters WHERE user_id = ? ORDER BY created_at DESC', (user_id,))
-    disputes = c.fetchall()
-    conn.close()
-    return disputes
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute('SELECT id, bureau, error_description, status, purchased, created_at FROM dispute_letters WHERE user_id = ? ORDER BY created_at DESC', (user_id,))
+        return c.fetchall()
 
 def show_login_page():
     try:
@@ -204,7 +253,7 @@ def show_login_page_original():
                     st.success("✅ Logged in successfully!")
                     st.rerun()
                 else:
-                    st.error("❌ Invalid email or password")
+                    st.error(f"❌ {user_data.get('error', 'Invalid email or password')}")
     with tab2:
         with st.form("signup_form"):
             new_email = st.text_input("Email", key="signup_email")
@@ -232,20 +281,21 @@ def show_login_page_original():
 def show_user_dashboard():
     user = st.session_state.user
     stats = get_user_stats(user['id'])
-    st.session_state.user['plan'] = stats['plan']
+    plan = entitlements.get(user['id'])['plan']
+    st.session_state.user['plan'] = plan
     with st.sidebar:
         st.markdown(f"### 👤 {user['email']}")
-        if stats['plan'] in ('pro', 'premium'):
+        if plan in ('pro', 'premium'):
             st.success("⭐ Pro Plan")
-        elif stats['plan'] == 'basic':
+        elif plan == 'basic':
             st.info("🔵 Basic Plan")
         else:
             st.info("📦 Free Tier")
         st.markdown("---")
         st.markdown("**📊 Your Usage**")
-        if stats['plan'] == 'free':
-            st.write(f"Reports Analyzed: {stats['reports_analyzed']}/1")
-            if stats['reports_analyzed'] >= 1:
+        if plan == 'free':
+            st.write(f"Reports Analyzed: {stats['reports_analyzed']}/{entitlements.FREE_ANALYSES}")
+            if stats['reports_analyzed'] >= entitlements.FREE_ANALYSES:
                 st.warning("⚠️ Free tier limit reached")
             import stripe_integration
             if st.button("🚀 Upgrade Now", use_container_width=True, type="primary"):
@@ -272,6 +322,3 @@ def require_auth(func):
             return
         return func(*args, **kwargs)
     return wrapper
-
-# Initialize database on import
-init_database()
@@ -0,0 +1,217 @@
+"""
+Bureau Report Parsers for Credit CPR
+Rule-based parsing of known credit report layouts into the structured report schema
+"""
+
+import re
+import report_chunking
+
+# Layout detection: every pattern must appear in the first pages of the report
+LAYOUTS = {
+    "experian": {
+        "bureau": "Experian",
+        "detect": [r"\bexperian\b", r"\breport (?:number|#)"],
+        "creditor_label": r"account name|company name",
+    },
+    "equifax": {
+        "bureau": "Equifax",
+        "detect": [r"\bequifax\b", r"\bconfirmation (?:number|#)"],
+        "creditor_label": r"creditor(?: name)?",
+    },
+    "transunion": {
+        "bureau": "TransUnion",
+        "detect": [r"\btransunion\b", r"\bfile number\b"],
+        "creditor_label": r"subscriber name|creditor",
+    },
+}
+
+# annualcreditreport.com delivers each bureau's own layout behind its own banner
+ANNUAL_CREDIT_REPORT_MARKER = r"annualcreditreport\.com"
+
+FIELD_LABELS = {
+    "account_num": r"account (?:number|#|no\.?)",
+    "balance": r"(?:current |recent )?balance(?: owed)?",
+    "status": r"(?:account |pay(?:ment)? )?status|condition",
+    "payment_history": r"payment history|(?:24|48|84)[- ]month (?:payment )?history",
+    # Public record dates; account dates are read only from their own labels below
+    "date": r"date (?:reported|filed)|date",
+    "date_opened": r"date opened|open(?:ed)? date",
+    "delinquency_date": r"date of (?:first|1st) delinquency|first delinquency(?: date)?|dofd",
+    "type": r"(?:record |account )?type",
+}
+
+PERSONAL_LABELS = {
+    "name": r"(?:consumer |full )?names?|(?:report )?prepared for",
+    "address": r"(?:current |previous |other )?address(?:es)?",
+    "dob": r"date of birth|year of birth|birth ?date",
+    "ssn": r"social security(?: number)?|ssn",
+}
+
+NEGATIVE_STATUS_RE = re.compile(
+    r"\b(?:late|past due|delinquen(?:t|cy)|charged?[ -]?off|collections?|repossess(?:ed|ion)?|foreclos(?:ed|ure)"
+    r"|default(?:ed)?|derogatory|(?:30|60|90|120|150|180)[ -]days?)\b",
+    re.IGNORECASE,
+)
+# Clean statuses that mention a negative word, e.g. "Open/Never late", "No late payments"
+NEGATED_STATUS_RE = re.compile(
+    r"\b(?:never|not|no|zero|0)\b(?:[ \t]+\w+){0,2}?[ \t]+(?:late|past due|delinquen(?:t|cy))\b",
+    re.IGNORECASE,
+)
+
+_DATE_RE = r"\d{1,2}/\d{1,2}/\d{2,4}|\d{1,2}/\d{4}|\d{4}-\d{2}-\d{2}|[A-Z][a-z]{2,8}\.? \d{1,2},? \d{4}|[A-Z][a-z]{2,8} \d{4}"
+_INQUIRY_RE = re.compile(rf"^\s*(?P<company>[A-Za-z0-9&.,'/ -]{{2,80}}?)\s*(?:[-:|]|\s{{2,}}|\s)\s*(?P<date>{_DATE_RE})\s*$")
+
+
+def _labeled(text: str, label: str):
+    match = re.search(rf"^[ \t]*(?:{label})[ \t]*[:#][ \t]*(.+?)[ \t]*$", text, re.IGNORECASE | re.MULTILINE)
+    return match.group(1) if match else None
+
+
+def _parse_amount(value) -> int:
+    if not value:
+        return 0
+    match = re.search(r"-?[\d,]+(?:\.\d+)?", value.replace("$", ""))
+    if not match:
+        return 0
+    return int(round(float(match.group(0).replace(",", ""))))
+
+
+def is_negative_status(status: str) -> bool:
+    """True if an account status reports a derogatory condition"""
+    return bool(NEGATIVE_STATUS_RE.search(NEGATED_STATUS_RE.sub(" ", status or "")))
+
+
+def detect_layout(raw_text: str):
+    """Return the layout name for a recognized bureau report, or None"""
+    head = raw_text[:5000]
+    for name, layout in LAYOUTS.items():
+        if all(re.search(p, head, re.IGNORECASE) for p in layout["detect"]):
+            return name
+    if re.search(ANNUAL_CREDIT_REPORT_MARKER, head, re.IGNORECASE):
+        # annualcreditreport.com copies keep the bureau banner but not always its report id
+        for name in LAYOUTS:
+            if re.search(LAYOUTS[name]["detect"][0], head, re.IGNORECASE):
+                return name
+    return None
+
+
+def _parse_personal_info(text: str) -> dict:
+    name = _labeled(text, PERSONAL_LABELS["name"]) or ""
+    addresses = [
+        m.group(1).strip()
+        for m in re.finditer(rf"^[ \t]*(?:{PERSONAL_LABELS['address']})[ \t]*:[ \t]*(.+?)[ \t]*$",
+                             text, re.IGNORECASE | re.MULTILINE)
+    ]
+    ssn = _labeled(text, PERSONAL_LABELS["ssn"]) or ""
+    ssn_digits = re.sub(r"\D", "", ssn)
+    return {
+        "name": name,
+        "addresses": addresses,
+        "ssn_last4": ssn_digits[-4:] if len(ssn_digits) >= 4 else "",
+        "dob": _labeled(text, PERSONAL_LABELS["dob"]) or "",
+    }
+
+
+def _account_blocks(text: str, creditor_label: str) -> list:
+    """Split an accounts section into (creditor, block_text) pairs"""
+    lines = text.splitlines()
+    label_re = re.compile(rf"^[ \t]*(?:{creditor_label})[ \t]*:[ \t]*(.+?)[ \t]*$", re.IGNORECASE)
+    number_re = re.compile(rf"^[ \t]*(?:{FIELD_LABELS['account_num']})[ \t]*[:#]", re.IGNORECASE)
+
+    starts = [(i, label_re.match(line).group(1)) for i, line in enumerate(lines) if label_re.match(line)]
+    if not starts:
+        # Layouts that print the creditor as a bare heading above the account number
+        for i, line in enumerate(lines):
+            if number_re.match(line):
+                j = i - 1
+                while j >= 0 and not lines[j].strip():
+                    j -= 1
+                if j >= 0 and ":" not in lines[j]:
+                    starts.append((j, lines[j].strip()))
+
+    blocks = []
+    for n, (start, creditor) in enumerate(starts):
+        end = starts[n + 1][0] if n + 1 < len(starts) else len(lines)
+        blocks.append((creditor, "\n".join(lines[start:end])))
+    return blocks
+
+
+def _parse_accounts(text: str, creditor_label: str, bureau: str) -> list:
+    accounts = []
+    for creditor, block in _account_blocks(text, creditor_label):
+        accounts.append({
+            "creditor": creditor,
+            "account_num": _labeled(block, FIELD_LABELS["account_num"]) or "",
+            "balance": _parse_amount(_labeled(block, FIELD_LABELS["balance"])),
+            "status": _labeled(block, FIELD_LABELS["status"]) or "",
+            "payment_history": _labeled(block, FIELD_LABELS["payment_history"]) or "",
+            "date_opened": _labeled(block, FIELD_LABELS["date_opened"]) or "",
+            "date_of_first_delinquency": _labeled(block, FIELD_LABELS["delinquency_date"]) or "",
+            "bureau": bureau,
+        })
+    return accounts
+
+
+def _parse_inquiries(text: str) -> list:
+    inquiries = []
+    for line in text.splitlines()[1:]:
+        match = _INQUIRY_RE.match(line)
+        if match:
+            inquiries.append({"company": match.group("company").strip(" -:|"), "date": match.group("date")})
+    return inquiries
+
+
+def _parse_public_records(text: str) -> list:
+    records = []
+    blocks = re.split(rf"(?=^[ \t]*(?:{FIELD_LABELS['type']})[ \t]*:)", text, flags=re.IGNORECASE | re.MULTILINE)
+    for block in blocks:
+        record_type = _labeled(block, FIELD_LABELS["type"])
+        if record_type:
+            records.append({
+                "type": record_type,
+                "status": _labeled(block, FIELD_LABELS["status"]) or "",
+                "date": _labeled(block, FIELD_LABELS["date"]) or "",
+            })
+    return records
+
+
+def parse_known_layout(raw_text: str):
+    """Parse a recognized bureau report locally.
+
+    Returns a dict in the same schema as the AI parse (app.PARSE_PROMPT_TEMPLATE), or None
+    when the layout is unknown or the parse looks incomplete, in which case
+    the caller should fall back to the AI parser.
+    """
+    layout_name = detect_layout(raw_text)
+    if not layout_name:
+        return None
+    layout = LAYOUTS[layout_name]
+
+    personal_text, accounts, inquiries, public_records = [], [], [], []
+    for kind, text in report_chunking.find_sections(raw_text):
+        if kind in ("preamble", "personal_info"):
+            personal_text.append(text)
+        elif kind == "accounts":
+            accounts.extend(_parse_accounts(text, layout["creditor_label"], layout["bureau"]))
+        elif kind == "inquiries":
+            inquiries.extend(_parse_inquiries(text))
+        elif kind == "public_records":
+            public_records.extend(_parse_public_records(text))
+
+    personal_info = _parse_personal_info("\n".join(personal_text))
+    if not accounts or not personal_info["name"]:
+        return None
+
+    negative_items = [
+        {"description": f"{a['creditor']} - {a['status']}", "date": a["date_of_first_delinquency"]}
+        for a in accounts
+        if is_negative_status(a["status"])
+    ]
+
+    return {
+        "personal_info": personal_info,
+        "accounts": accounts,
+        "inquiries": inquiries,
+        "public_records": public_records,
+        "negative_items": negative_items,
+    }
@@ -7,19 +7,11 @@ AI Chat Assistant for Credit CPR
 - Smart quick prompts
 """
 
-import os
 from datetime import datetime
 import streamlit as st
-
-
-def _get_api_key() -> str:
-    try:
-        key = st.secrets.get("ANTHROPIC_API_KEY", "")
-    except Exception:
-        key = ""
-    if not key:
-        key = os.getenv("ANTHROPIC_API_KEY", "")
-    return key
+import entitlements
+import ai_streaming
+import ai_client
 
 
 def _extract_memory_candidate(user_input: str):
@@ -88,7 +80,7 @@ def _summarize_credit_context(credit_data=None, errors=None) -> str:
 
 
 def get_system_prompt(credit_data=None, errors=None):
-    user_plan = (st.session_state.get("user") or {}).get("plan", "free")
+    user_plan = entitlements.current()["plan"]
     chat_memory = st.session_state.get("chat_memory", [])
 
     base_prompt = """You are Credit CPR's AI Credit Specialist — a knowledgeable, friendly expert in:
@@ -180,8 +172,9 @@ def _build_quick_questions():
 def show_chat_assistant():
     _ensure_session_state()
 
-    user_plan = (st.session_state.get("user") or {}).get("plan", "free")
-    is_paid = user_plan in ("basic", "pro", "premium")
+    user_entitlements = entitlements.current()
+    user_plan = user_entitlements["plan"]
+    is_paid = "chat_assistant" in user_entitlements["features"]
 
     st.header("💬 AI Credit Specialist")
     st.caption("Ask about credit repair, FCRA rights, dispute strategy, collections, and credit-building.")
@@ -248,16 +241,15 @@ def show_chat_assistant():
         st.success("⭐ Pro/Premium Plan Active")
 
     for msg in st.session_state.chat_messages:
-        avatar = "🛡️" if msg["role"] == "assistant" else "👤"
-        with st.chat_message(msg["role"], avatar=avatar):
-            st.markdown(msg["content"])
-            st.caption(msg.get("timestamp", ""))
+        _render_message(msg)
+
+    # New turns stream here, below the existing history
+    live_turn = st.container()
 
     if st.session_state.pending_message:
         user_input = st.session_state.pending_message
         st.session_state.pending_message = None
-        process_message(user_input)
-        st.rerun()
+        process_message(user_input, live_turn)
 
     col1, col2 = st.columns([5, 1])
     with col1:
@@ -271,8 +263,7 @@ def show_chat_assistant():
         send_clicked = st.button("Send 💬", use_container_width=True, type="primary")
 
     if send_clicked and user_input and user_input.strip():
-        process_message(user_input.strip())
-        st.rerun()
+        process_message(user_input.strip(), live_turn)
 
     st.markdown("### 💡 Good things to ask")
     st.markdown(
@@ -290,8 +281,19 @@ def show_chat_assistant():
             st.rerun()
 
 
-def process_message(user_input: str):
+def _render_message(msg: dict):
+    avatar = "🛡️" if msg["role"] == "assistant" else "👤"
+    with st.chat_message(msg["role"], avatar=avatar):
+        st.markdown(msg["content"])
+        st.caption(msg.get("timestamp", ""))
+
+
+def process_message(user_input: str, container=None):
+    """Answer a user message, streaming the reply into container as it arrives"""
+    container = container or st.container()
     _append_message("user", user_input)
+    with container:
+        _render_message(st.session_state.chat_messages[-1])
 
     memory_candidate = _extract_memory_candidate(user_input)
     if memory_candidate and memory_candidate not in st.session_state.chat_memory:
@@ -308,38 +310,43 @@ def process_message(user_input: str):
         if m["role"] in ("user", "assistant")
     ]
 
-    api_key = _get_api_key()
+    api_key = ai_client.get_api_key()
     if not api_key:
         _append_message(
             "assistant",
             "⚠️ I'm not connected right now because the Anthropic API key is missing. Please add ANTHROPIC_API_KEY to Render environment variables.",
         )
+        with container:
+            _render_message(st.session_state.chat_messages[-1])
         return
 
-    try:
-        from anthropic import Anthropic
-
-        with st.spinner("🤖 Thinking..."):
-            client = Anthropic(api_key=api_key)
-            response = client.messages.create(
-                model="claude-3-5-sonnet-latest",
-                max_tokens=1024,
-                system=system_prompt,
-                messages=api_messages,
-            )
-
-        assistant_reply = response.content[0].text
-
-        lower = user_input.lower()
-        if "dispute letter" in lower or "write a dispute" in lower:
-            assistant_reply += "\n\n📄 Ready to generate one? Jump to the **Dispute Letters** tab!"
-        if "plan" in lower or "next 30 days" in lower or "what should i do" in lower:
-            assistant_reply += "\n\n📈 Check the **Credit Plan** tab for your full 90-day action plan!"
-
-    except Exception as e:
-        assistant_reply = (
-            "⚠️ I'm having trouble connecting right now. Please try again in a moment.\n\n"
-            f"*(Error: {str(e)})*"
-        )
-
-    _append_message("assistant", assistant_reply)
+    with container:
+        with st.chat_message("assistant", avatar="🛡️"):
+            reply_placeholder = st.empty()
+            reply_placeholder.markdown("🤖 Thinking...")
+            try:
+                client = ai_client.get_client(api_key)
+                assistant_reply = ai_streaming.stream_text(
+                    client,
+                    reply_placeholder,
+                    model="claude-3-5-sonnet-latest",
+                    max_tokens=1024,
+                    system=system_prompt,
+                    messages=api_messages,
+                )
+
+                lower = user_input.lower()
+                if "dispute letter" in lower or "write a dispute" in lower:
+                    assistant_reply += "\n\n📄 Ready to generate one? Jump to the **Dispute Letters** tab!"
+                if "plan" in lower or "next 30 days" in lower or "what should i do" in lower:
+                    assistant_reply += "\n\n📈 Check the **Credit Plan** tab for your full 90-day action plan!"
+
+            except Exception as e:
+                assistant_reply = (
+                    "⚠️ I'm having trouble connecting right now. Please try again in a moment.\n\n"
+                    f"*(Error: {str(e)})*"
+                )
+
+            _append_message("assistant", assistant_reply)
+            reply_placeholder.markdown(assistant_reply)
+            st.caption(st.session_state.chat_messages[-1]["timestamp"])
@@ -0,0 +1,69 @@
+"""
+Batch Dispute Letters for Credit CPR
+Writes one paragraph per error concurrently, renders it for every bureau and packages the letters as a ZIP
+"""
+
+import re
+import zipfile
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import letter_templates
+
+BUREAUS = ("Equifax", "Experian", "TransUnion")
+
+# Concurrent model calls per batch; one call per error, never per bureau
+MAX_CONCURRENCY = 6
+
+
+def generate_all(errors, user_info, paragraph_fn, bureaus=BUREAUS, max_workers=MAX_CONCURRENCY, on_progress=None):
+    """Generate a letter for each (error, bureau) pair.
+
+    paragraph_fn(error) returns the error-specific paragraph, which only
+    differs by error, so it is called once per error and rendered into each
+    bureau's letter with letter_templates.render_letter.
+    on_progress(done, total) is called from the calling thread with letter
+    counts as each error's letters are ready.
+    Returns a list of dicts (error, bureau, letter_text, failure) in
+    error-then-bureau order; failure is None on success.
+    """
+    results = [None] * len(errors)
+    total = len(errors) * len(bureaus)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(paragraph_fn, error): index for index, error in enumerate(errors)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            index = futures[future]
+            error = errors[index]
+            try:
+                paragraph = future.result()
+                results[index] = [
+                    {"error": error, "bureau": bureau, "failure": None,
+                     "letter_text": letter_templates.render_letter(error, user_info, bureau, paragraph)}
+                    for bureau in bureaus
+                ]
+            except Exception as e:
+                results[index] = [{"error": error, "bureau": bureau, "letter_text": None, "failure": str(e)}
+                                  for bureau in bureaus]
+            if on_progress:
+                on_progress(done * len(bureaus), total)
+    return [letter for letters in results for letter in letters]
+
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", str(value or "").lower()).strip("_")[:40] or "error"
+
+
+def build_zip(letters, docx_fn) -> bytes:
+    """Package generated letters as .docx files in one ZIP.
+
+    docx_fn(letter_text) returns a file-like object or bytes of the document.
+    """
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for n, letter in enumerate(letters, start=1):
+            if not letter["letter_text"]:
+                continue
+            document = docx_fn(letter["letter_text"])
+            data = document if isinstance(document, bytes) else document.getvalue()
+            name = f"{n:02d}_{letter['bureau']}_{_slug(letter['error'].get('category'))}.docx"
+            archive.writestr(name, data)
+    return buffer.getvalue()
@@ -0,0 +1,162 @@
+"""
+Document Builder for Credit CPR
+Renders letters and plans to DOCX and PDF, caching the bytes by content hash
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from docx import Document
+from docx.shared import Pt, Inches
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+PDF_MIME = "application/pdf"
+
+# Rendered documents kept per process; a letter is a few tens of KB
+CACHE_ENTRIES = 128
+
+FONT_NAME = "Times New Roman"
+FONT_SIZE = 12
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _cached(kind: str, text: str, render):
+    key = (kind, hashlib.sha256(text.encode("utf-8")).hexdigest())
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    data = render(text)
+    with _lock:
+        _cache[key] = data
+        while len(_cache) > CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return data
+
+
+def _render_docx(text: str) -> bytes:
+    doc = Document()
+
+    # Configure the shared style once instead of once per paragraph
+    normal = doc.styles["Normal"]
+    normal.font.name = FONT_NAME
+    normal.font.size = Pt(FONT_SIZE)
+
+    for section in doc.sections:
+        section.top_margin = Inches(1)
+        section.bottom_margin = Inches(1)
+        section.left_margin = Inches(1)
+        section.right_margin = Inches(1)
+
+    for line in text.split("\n"):
+        doc.add_paragraph(line)
+
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def build_docx(text: str) -> bytes:
+    """Word document bytes for text, one paragraph per line"""
+    return _cached("docx", text, _render_docx)
+
+
+# --- PDF -----------------------------------------------------------------
+# A minimal single-font PDF writer: US Letter, 1 inch margins, Times-Roman.
+
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+MARGIN = 72
+LINE_HEIGHT = 14.5
+PDF_FONT_SIZE = 11
+
+# Approximate Times-Roman advance widths (1/1000 em), rounded up so
+# wrapped lines never overrun the margin
+_NARROW = set("ijlft.,;:'!|()[] ")
+_WIDE = set("mwMW@%")
+
+
+def _char_width(ch: str) -> float:
+    if ch in _NARROW:
+        return 0.28
+    if ch in _WIDE:
+        return 0.95
+    if ch.isupper():
+        return 0.73
+    return 0.52
+
+
+def _wrap(line: str, max_width: float) -> list:
+    if not line.strip():
+        return [""]
+    lines, current, width = [], "", 0.0
+    for word in line.split(" "):
+        word_width = sum(_char_width(ch) for ch in word) * PDF_FONT_SIZE
+        space = _char_width(" ") * PDF_FONT_SIZE if current else 0.0
+        if current and width + space + word_width > max_width:
+            lines.append(current)
+            current, width = word, word_width
+        else:
+            current = f"{current} {word}" if current else word
+            width += space + word_width
+    lines.append(current)
+    return lines
+
+
+def _escape(line: str) -> bytes:
+    data = line.encode("cp1252", errors="replace")
+    return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _render_pdf(text: str) -> bytes:
+    max_width = PAGE_WIDTH - 2 * MARGIN
+    lines = [wrapped for line in text.split("\n") for wrapped in _wrap(line, max_width)]
+    per_page = int((PAGE_HEIGHT - 2 * MARGIN) // LINE_HEIGHT)
+    pages = [lines[i:i + per_page] for i in range(0, len(lines), per_page)] or [[]]
+
+    objects = []  # object bodies, numbered from 1
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")  # filled in once the page tree exists
+    pages_obj = add(b"")
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Times-Roman /Encoding /WinAnsiEncoding >>")
+
+    page_ids = []
+    for page_lines in pages:
+        stream = [b"BT", f"/F1 {PDF_FONT_SIZE} Tf {LINE_HEIGHT} TL {MARGIN} {PAGE_HEIGHT - MARGIN} Td".encode()]
+        for line in page_lines:
+            stream.append(b"(" + _escape(line) + b") Tj T*")
+        stream.append(b"ET")
+        content = b"\n".join(stream)
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        page_ids.append(add(
+            f"<< /Type /Page /Parent {pages_obj} 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> /Contents {content_id} 0 R >>".encode()
+        ))
+
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects[pages_obj - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+    objects[catalog - 1] = f"<< /Type /Catalog /Pages {pages_obj} 0 R >>".encode()
+
+    out = BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref))
+    return out.getvalue()
+
+
+def build_pdf(text: str) -> bytes:
+    """PDF bytes for text, wrapped and paginated"""
+    return _cached("pdf", text, _render_pdf)
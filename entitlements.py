@@ -0,0 +1,112 @@
+"""
+Entitlements for Credit CPR
+Resolves a user's effective plan and feature access once, then serves every plan gate from memory
+"""
+
+import time
+import threading
+from datetime import datetime
+import streamlit as st
+import db
+
+PAID_PLANS = ("basic", "pro", "premium")
+
+# Feature -> plans that include it
+FEATURES = {
+    "unlimited_analyses": PAID_PLANS,
+    "score_tracker": PAID_PLANS,
+    "dispute_tracker": PAID_PLANS,
+    "credit_coach": PAID_PLANS,
+    "chat_assistant": PAID_PLANS,
+}
+
+FREE_ANALYSES = 1
+
+# Plan writes invalidate explicitly; the TTL covers writes made by other processes
+TTL_SECONDS = 60
+MAX_ENTRIES = 5000
+
+_FREE = {"plan": "free", "override_expires_at": None, "features": frozenset()}
+
+_cache = {}  # user_id -> (expires_at, entitlements)
+_lock = threading.Lock()
+
+
+def _features(plan: str) -> frozenset:
+    return frozenset(feature for feature, plans in FEATURES.items() if plan in plans)
+
+
+def _latest_override(conn, user_id: int):
+    """(plan, timed_grant_expires_at, previous_plan) for a user, or None"""
+    row = conn.execute('''SELECT u.plan, o.override_type, o.expires_at, o.previous_plan
+        FROM users u
+        LEFT JOIN user_overrides o ON o.id = (SELECT MAX(id) FROM user_overrides WHERE user_id = u.id)
+        WHERE u.id = ?''', (user_id,)).fetchone()
+    if row is None:
+        return None
+    plan, override_type, expires_at, previous_plan = row
+    plan = plan or "free"
+    expires_at = datetime.fromisoformat(str(expires_at)) if expires_at else None
+    if not (expires_at and override_type == f"plan_{plan}"):
+        expires_at = None  # the plan isn't a timed grant (or it changed since)
+    return plan, expires_at, previous_plan
+
+
+def base_plan(conn, user_id: int) -> str:
+    """The plan beneath any timed grant: what the user returns to when it expires.
+
+    Grants recorded before previous_plan was kept never lapse, since the plan
+    they replaced (possibly a paid subscription) is unknown.
+    """
+    latest = _latest_override(conn, user_id)
+    if latest is None:
+        return "free"
+    plan, expires_at, previous_plan = latest
+    return (previous_plan or plan) if expires_at else plan
+
+
+def _resolve(user_id: int) -> dict:
+    with db.transaction() as conn:
+        latest = _latest_override(conn, user_id)
+    if latest is None:
+        return dict(_FREE)
+    plan, expires_at, previous_plan = latest
+    if expires_at and expires_at < datetime.now():
+        # The timed grant has lapsed
+        plan = previous_plan or plan
+        expires_at = None
+    return {"plan": plan, "override_expires_at": expires_at, "features": _features(plan)}
+
+
+def get(user_id: int) -> dict:
+    """{plan, override_expires_at, features} for a user"""
+    now = time.monotonic()
+    with _lock:
+        cached = _cache.get(user_id)
+        if cached and cached[0] > now:
+            return cached[1]
+    entitlements = _resolve(user_id)
+    with _lock:
+        if len(_cache) >= MAX_ENTRIES:
+            _cache.clear()
+        _cache[user_id] = (now + TTL_SECONDS, entitlements)
+    return entitlements
+
+
+def invalidate(user_id: int = None):
+    """Call after any write to a user's plan; None drops every user"""
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+
+def has_feature(user_id: int, feature: str) -> bool:
+    return feature in get(user_id)["features"]
+
+
+def current() -> dict:
+    """Entitlements of the signed-in user, or the free tier when signed out"""
+    user = st.session_state.get("user")
+    return get(user["id"]) if user else _FREE
@@ -0,0 +1,208 @@
+"""
+Error Rules Engine for Credit CPR
+Flags mechanically checkable report errors locally before the AI analysis
+"""
+
+import re
+from datetime import date, datetime
+
+# FCRA §605 reporting periods
+OBSOLETE_YEARS = 7
+BANKRUPTCY_OBSOLETE_YEARS = 10
+
+MEDICAL_DEBT_THRESHOLD = 500
+
+MEDICAL_RE = re.compile(r"medical|hospital|health|clinic|physician|surgery|radiology|ambulance|emergency|anesthesi|pathology|dental", re.IGNORECASE)
+NEGATIVE_RE = re.compile(r"late|past due|delinquen|charge[d -]?off|collection|repossess|foreclos|default|derogatory", re.IGNORECASE)
+BANKRUPTCY_RE = re.compile(r"bankrupt|chapter (?:7|11|13)", re.IGNORECASE)
+
+ALL_SECTIONS = ("accounts", "negative_items", "public_records", "inquiries")
+
+_DATE_FORMATS = ("%m/%d/%Y", "%m/%d/%y", "%Y-%m-%d", "%m/%Y", "%m-%Y", "%b %Y", "%B %Y", "%b %d, %Y", "%B %d, %Y", "%Y")
+
+
+def parse_date(value):
+    """Best-effort parse of the date formats bureaus and the parser produce"""
+    text = str(value or "").strip().replace(".", "")
+    if not text:
+        return None
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    match = re.search(r"\b(19|20)\d{2}\b", text)
+    return date(int(match.group(0)), 1, 1) if match else None
+
+
+def _years_ago(then, today) -> float:
+    return (today - then).days / 365.25
+
+
+def _norm(value) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(value or "").lower())
+
+
+def _amount(value) -> float:
+    try:
+        return float(str(value).replace("$", "").replace(",", ""))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _account_key(account: dict):
+    """What two tradelines must share to be the same debt, or None if too little is known.
+
+    Tri-bureau reports print each tradeline once per bureau, masked differently
+    and with balances from different reporting dates, so only copies from one
+    bureau agreeing on the full account number, open date and balance count.
+    """
+    creditor = _norm(account.get("creditor"))
+    number = _norm(account.get("account_num"))
+    opened = parse_date(account.get("date_opened"))
+    if not creditor or len(re.sub(r"\D", "", number)) < 4 or opened is None:
+        return None
+    return (_norm(account.get("bureau")), creditor, number, opened, _amount(account.get("balance")))
+
+
+def _delinquent_since(account: dict, today):
+    """First-delinquency date of a negative account older than the reporting period, else None"""
+    # §605(c): the period runs from the first delinquency, not from the date opened
+    when = parse_date(account.get("date_of_first_delinquency"))
+    if NEGATIVE_RE.search(str(account.get("status") or "")) and when and _years_ago(when, today) > OBSOLETE_YEARS:
+        return when
+    return None
+
+
+def _creditor_matches(company: str, creditors: list) -> bool:
+    company = _norm(company)
+    if not company:
+        return True
+    return any(c and (company in c or c in company or company[:6] == c[:6]) for c in creditors)
+
+
+def evaluate(credit_data: dict, today=None, sections=ALL_SECTIONS) -> tuple:
+    """Run the rules for the given sections over the structured report.
+
+    Returns (errors, residual_data). errors use the same fields as the AI
+    analysis; residual_data is credit_data minus the items a rule already
+    flagged, for the model to review. The inquiry rule compares against
+    every account, so only run it once all accounts are known.
+    """
+    today = today or date.today()
+    credit_data = credit_data or {}
+    accounts = credit_data.get("accounts") or []
+    inquiries = credit_data.get("inquiries") or []
+    public_records = credit_data.get("public_records") or []
+    negative_items = credit_data.get("negative_items") or []
+
+    errors = []
+    flagged = {"accounts": set(), "inquiries": set(), "public_records": set(), "negative_items": set()}
+
+    def add(section, index, **error):
+        error["id"] = f"RULE{len(errors) + 1:03d}"
+        error["source"] = "rules"
+        errors.append(error)
+        flagged[section].add(index)
+
+    # Negative items repeat their account's delinquency; the account rule
+    # reports it, even when accounts are evaluated in another pass
+    obsolete_creditors = [_norm(a.get("creditor")) for a in accounts if _delinquent_since(a, today)]
+
+    seen_accounts = {}
+    for i, account in enumerate(accounts if "accounts" in sections else []):
+        creditor = account.get("creditor") or "Unknown creditor"
+        status = str(account.get("status") or "")
+        balance = _amount(account.get("balance"))
+
+        key = _account_key(account)
+        if key is not None and key in seen_accounts:
+            add("accounts", i,
+                category="Duplicate Account", severity="High",
+                description=f"{creditor} appears more than once on the report for the same debt",
+                fcra_violation="FCRA §607(b) / §1681e(b) - maximum possible accuracy",
+                affected_item=creditor,
+                dispute_strategy="Dispute the duplicate tradeline and request deletion of the repeated entry",
+                success_likelihood=85,
+                potential_impact="20-40 points")
+            continue
+        if key is not None:
+            seen_accounts[key] = i
+
+        if (MEDICAL_RE.search(creditor) or MEDICAL_RE.search(status)) and 0 < balance < MEDICAL_DEBT_THRESHOLD \
+                and NEGATIVE_RE.search(status):
+            add("accounts", i,
+                category="Medical Debt Under $500", severity="High",
+                description=f"{creditor} is a medical collection of ${balance:,.0f}, below the $500 reporting threshold",
+                fcra_violation="Bureau medical debt policy (2023) / FCRA §1681e(b)",
+                affected_item=creditor,
+                dispute_strategy="Dispute as medical debt under $500 that should not be reported",
+                success_likelihood=90,
+                potential_impact="15-50 points")
+            continue
+
+        delinquent_since = _delinquent_since(account, today)
+        if delinquent_since:
+            add("accounts", i,
+                category="Obsolete Information", severity="High",
+                description=f"{creditor} has been delinquent since {delinquent_since:%m/%Y}, more than {OBSOLETE_YEARS} years ago",
+                fcra_violation="FCRA §605(a) - obsolete information",
+                affected_item=creditor,
+                dispute_strategy="Dispute as obsolete and request removal under §605",
+                success_likelihood=85,
+                potential_impact="20-60 points")
+
+    for i, item in enumerate(negative_items if "negative_items" in sections else []):
+        when = parse_date(item.get("date"))
+        if any(_norm(item.get("description")).startswith(c) for c in obsolete_creditors if c):
+            continue  # the same delinquency, already flagged on its account
+        if when and _years_ago(when, today) > OBSOLETE_YEARS:
+            add("negative_items", i,
+                category="Obsolete Information", severity="High",
+                description=f"{item.get('description') or 'Negative item'} dated {when:%m/%Y} is older than {OBSOLETE_YEARS} years",
+                fcra_violation="FCRA §605(a) - obsolete information",
+                affected_item=item.get("description") or "Negative item",
+                dispute_strategy="Dispute as obsolete and request removal under §605",
+                success_likelihood=85,
+                potential_impact="20-60 points")
+
+    for i, record in enumerate(public_records if "public_records" in sections else []):
+        when = parse_date(record.get("date"))
+        record_type = str(record.get("type") or "Public record")
+        limit = BANKRUPTCY_OBSOLETE_YEARS if BANKRUPTCY_RE.search(record_type) else OBSOLETE_YEARS
+        if when and _years_ago(when, today) > limit:
+            add("public_records", i,
+                category="Obsolete Information", severity="High",
+                description=f"{record_type} dated {when:%m/%Y} is older than {limit} years",
+                fcra_violation="FCRA §605(a) - obsolete information",
+                affected_item=record_type,
+                dispute_strategy="Dispute as obsolete and request removal under §605(a)",
+                success_likelihood=90,
+                potential_impact="40-100 points")
+
+    creditors = [_norm(a.get("creditor")) for a in accounts]
+    for i, inquiry in enumerate(inquiries if "inquiries" in sections else []):
+        company = inquiry.get("company") or ""
+        if not _creditor_matches(company, creditors):
+            add("inquiries", i,
+                category="Unauthorized Inquiry", severity="Low",
+                description=f"Hard inquiry by {company} with no matching account on the report",
+                fcra_violation="FCRA §604 - permissible purpose",
+                affected_item=company,
+                dispute_strategy="Dispute the inquiry if you did not apply for credit with this company",
+                success_likelihood=60,
+                potential_impact="2-5 points")
+
+    residual = dict(credit_data)
+    for section, indexes in flagged.items():
+        if section not in sections:
+            continue
+        items = credit_data.get(section) or []
+        residual[section] = [item for n, item in enumerate(items) if n not in indexes]
+    return errors, residual
+
+
+def has_residual_items(residual: dict) -> bool:
+    """True if anything, personal info included, is left for the model to review"""
+    personal_info = residual.get("personal_info") or {}
+    return any(residual.get(section) for section in ALL_SECTIONS) or any(personal_info.values())
@@ -5,18 +5,37 @@ Google OAuth for Streamlit - Working Implementation
 import streamlit as st
 import requests
 import os
-import sqlite3
+import re
+import time
+import threading
 from urllib.parse import urlencode
+from requests.adapters import HTTPAdapter
+from google.auth import jwt
 
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", "")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET", "")
 
 GOOGLE_AUTH_URL = "https://accounts.google.com/o/oauth2/v2/auth"
 GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
-GOOGLE_USER_INFO_URL = "https://www.googleapis.com/oauth2/v2/userinfo"
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
 
 REDIRECT_URI = os.getenv("REDIRECT_URI", "https://credit-cpr.onrender.com")
 
+TIMEOUT = (5, 15)
+# Google rotates its signing keys over days; used when the response has no max-age
+CERTS_TTL_SECONDS = 3600
+CLOCK_SKEW_SECONDS = 10
+
+# Password hash for accounts created through Google; no password matches it
+GOOGLE_PASSWORD_MARKER = "!google"
+
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=8))
+
+_certs = {"expires_at": 0.0, "keys": None}
+_certs_lock = threading.Lock()
+
 def get_google_auth_url():
     params = {
         'client_id': GOOGLE_CLIENT_ID,
@@ -36,13 +55,52 @@ def exchange_code_for_token(code):
         'redirect_uri': REDIRECT_URI,
         'grant_type': 'authorization_code'
     }
-    response = requests.post(GOOGLE_TOKEN_URL, data=data)
+    response = _session.post(GOOGLE_TOKEN_URL, data=data, timeout=TIMEOUT)
     return response.json()
 
-def get_user_info(access_token):
-    headers = {'Authorization': f'Bearer {access_token}'}
-    response = requests.get(GOOGLE_USER_INFO_URL, headers=headers)
-    return response.json()
+def _google_certs(refresh=False):
+    """Google's ID-token signing certs, cached for as long as Google allows"""
+    with _certs_lock:
+        if refresh or _certs["keys"] is None or _certs["expires_at"] <= time.monotonic():
+            response = _session.get(GOOGLE_CERTS_URL, timeout=TIMEOUT)
+            response.raise_for_status()
+            max_age = re.search(r'max-age=(\d+)', response.headers.get('Cache-Control', ''))
+            ttl = int(max_age.group(1)) if max_age else CERTS_TTL_SECONDS
+            _certs["keys"] = response.json()
+            _certs["expires_at"] = time.monotonic() + ttl
+        return _certs["keys"]
+
+def verify_id_token(token):
+    """Claims of a Google ID token, checked locally against Google's signing certs"""
+    try:
+        claims = jwt.decode(token, certs=_google_certs(), audience=GOOGLE_CLIENT_ID,
+                            clock_skew_in_seconds=CLOCK_SKEW_SECONDS)
+    except ValueError as e:
+        if 'Certificate for key id' not in str(e):
+            raise
+        # Signed with a key published after our copy; refetch once
+        claims = jwt.decode(token, certs=_google_certs(refresh=True), audience=GOOGLE_CLIENT_ID,
+                            clock_skew_in_seconds=CLOCK_SKEW_SECONDS)
+    if claims.get('iss') not in GOOGLE_ISSUERS:
+        raise ValueError(f"Wrong issuer: {claims.get('iss')}")
+    return claims
+
+def upsert_google_user(email):
+    """The user with this email, created on first sign-in, in one statement"""
+    import db
+    with db.transaction() as conn:
+        user = conn.execute(
+            'INSERT INTO users (email, password_hash) VALUES (?, ?) '
+            'ON CONFLICT (email) DO UPDATE SET email = excluded.email '
+            'RETURNING id, email, plan, reports_analyzed, disputes_purchased',
+            (email, GOOGLE_PASSWORD_MARKER)).fetchone()
+    return {
+        'id': user[0],
+        'email': user[1],
+        'plan': user[2],
+        'reports_analyzed': user[3],
+        'disputes_purchased': user[4]
+    }
 
 def handle_google_callback():
     try:
@@ -59,49 +117,14 @@ def handle_google_callback():
     if code:
         try:
             token_data = exchange_code_for_token(code)
-            if 'access_token' in token_data:
-                user_info = get_user_info(token_data['access_token'])
-                email = user_info.get('email')
-                name = user_info.get('name', '')
+            if 'id_token' in token_data:
+                claims = verify_id_token(token_data['id_token'])
+                email = claims.get('email') if claims.get('email_verified') else None
 
                 if email:
-                    import auth
-                    conn = sqlite3.connect(auth.DB_PATH)
-                    c = conn.cursor()
-
-                    c.execute('SELECT id, email, plan, reports_analyzed, disputes_purchased FROM users WHERE email = ?', (email,))
-                    user = c.fetchone()
-
-                    if user:
-                        user_data = {
-                            'id': user[0],
-                            'email': user[1],
-                            'plan': user[2],
-                            'reports_analyzed': user[3],
-                            'disputes_purchased': user[4]
-                        }
-                        st.session_state.authenticated = True
-                        st.session_state.user = user_data
-                        st.success(f"✅ Signed in with Google as {email}")
-                    else:
-                        import secrets
-                        random_password = secrets.token_urlsafe(32)
-                        password_hash = auth.hash_password(random_password)
-                        c.execute('INSERT INTO users (email, password_hash) VALUES (?, ?)', (email, password_hash))
-                        user_id = c.lastrowid
-                        conn.commit()
-                        user_data = {
-                            'id': user_id,
-                            'email': email,
-                            'plan': 'free',
-                            'reports_analyzed': 0,
-                            'disputes_purchased': 0
-                        }
-                        st.session_state.authenticated = True
-                        st.session_state.user = user_data
-                        st.success(f"✅ Account created with Google! Welcome {name}!")
-
-                    conn.close()
+                    st.session_state.authenticated = True
+                    st.session_state.user = upsert_google_user(email)
+                    st.success(f"✅ Signed in with Google as {email}")
 
                     try:
                         st.query_params.clear()
@@ -110,9 +133,9 @@ def handle_google_callback():
 
                     st.rerun()
                 else:
-                    st.error("Could not get email from Google")
+                    st.error("Could not get a verified email from Google")
             else:
-                st.error("Failed to get access token from Google")
+                st.error("Failed to get an ID token from Google")
 
         except Exception as e:
             st.error(f"Error during Google sign-in: {str(e)}")
@@ -177,7 +200,7 @@ def show_login_page_with_google():
                     st.success("✅ Logged in successfully!")
                     st.rerun()
                 else:
-                    st.error("❌ Invalid email or password")
+                    st.error(f"❌ {user_data.get('error', 'Invalid email or password')}")
 
     with tab2:
         with st.form("signup_form"):
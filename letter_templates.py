@@ -0,0 +1,105 @@
+"""
+Dispute Letter Templates for Credit CPR
+Renders the fixed parts of a dispute letter locally; only the error paragraph varies
+"""
+
+import re
+from datetime import datetime
+
+BUREAU_ADDRESSES = {
+    "Equifax": "Equifax Information Services LLC\nP.O. Box 740256\nAtlanta, GA 30374-0256",
+    "Experian": "Experian\nP.O. Box 4500\nAllen, TX 75013",
+    "TransUnion": "TransUnion LLC\nConsumer Dispute Center\nP.O. Box 2000\nChester, PA 19016",
+}
+
+LETTER_TEMPLATE = """{name}
+{address}
+SSN (last 4): XXX-XX-{ssn_last4}
+Date of Birth: {dob}
+
+{date}
+
+{bureau_address}
+
+Re: Request for Investigation of Inaccurate Information - {affected_item}
+
+To Whom It May Concern:
+
+I am writing under Section 611 of the Fair Credit Reporting Act (15 U.S.C. § 1681i) to dispute the following information in my credit file, which is inaccurate or incomplete.
+
+Disputed item: {affected_item}
+Reason for dispute: {category}
+
+{paragraph}
+
+Under Section 607(b) of the FCRA (15 U.S.C. § 1681e(b)), you are required to follow reasonable procedures to assure the maximum possible accuracy of the information in my file. I request that you conduct a reasonable reinvestigation of this item within 30 days of receiving this letter, as Section 611 requires, and that you correct it or delete it if it cannot be verified.
+
+Please send me written confirmation of the results of your investigation, along with an updated copy of my credit report reflecting any changes.
+
+I am sending this letter by certified mail, return receipt requested, and I am keeping a copy for my records.
+
+Sincerely,
+
+
+
+{name}
+
+Enclosures: Copy of government-issued ID, proof of current address"""
+
+# Paragraphs for categories the rules engine can state without the model
+STANDARD_PARAGRAPHS = {
+    "duplicate account": (
+        "The account listed above appears on my report more than once for the same debt. "
+        "Reporting a single obligation multiple times overstates my debt and is inaccurate. "
+        "Please delete the duplicate entry so the debt is reported only once."
+    ),
+    "obsolete information": (
+        "This item is older than the reporting period allowed by Section 605 of the FCRA "
+        "(seven years, or ten years for a bankruptcy). {description}. "
+        "Obsolete information may not be reported, so please remove this item from my file."
+    ),
+    "medical debt under $500": (
+        "This is a medical collection with a balance under $500. The nationwide credit bureaus "
+        "stopped reporting medical collections under $500 in 2023, so this item should not appear on my report. "
+        "Please delete it."
+    ),
+    "unauthorized inquiry": (
+        "I do not recognize this hard inquiry and I did not authorize this company to access my credit report. "
+        "Section 604 of the FCRA permits access only for a permissible purpose. "
+        "Please verify that a permissible purpose existed or remove this inquiry."
+    ),
+}
+
+PARAGRAPH_PROMPT = """Write the one paragraph of a credit dispute letter that explains the error below.
+
+Error Details:
+{error}
+
+Write 3-5 sentences in the first person, factual and assertive. Explain what is wrong and what correction is requested.
+Do not include a greeting, closing, addresses, bureau names, or FCRA section citations - those are already in the letter, and the same paragraph is sent to every bureau.
+Return only the paragraph text."""
+
+
+def standard_paragraph(error: dict):
+    """Return the stock paragraph for a standard category, or None"""
+    template = STANDARD_PARAGRAPHS.get(str(error.get("category", "")).strip().lower())
+    if template is None:
+        return None
+    description = str(error.get("description") or "").rstrip(".")
+    return template.format(description=description or "The reporting period has expired")
+
+
+def render_letter(error: dict, user_info: dict, bureau_name: str, paragraph: str) -> str:
+    """Fill the letter template; paragraph is the error-specific explanation"""
+    address = user_info.get('address') or '123 Main St, City, ST 12345'
+    return LETTER_TEMPLATE.format(
+        name=user_info.get('name') or 'John Doe',
+        address=re.sub(r"\s*\n\s*", "\n", address.strip()),
+        ssn_last4=user_info.get('ssn_last4') or 'XXXX',
+        dob=user_info.get('dob') or 'MM/DD/YYYY',
+        date=datetime.now().strftime("%B %d, %Y"),
+        bureau_address=BUREAU_ADDRESSES.get(bureau_name, bureau_name),
+        affected_item=error.get('affected_item') or error.get('description') or 'See below',
+        category=error.get('category') or 'Inaccurate information',
+        paragraph=paragraph.strip(),
+    )
@@ -0,0 +1,198 @@
+"""
+Schema Migrations for Credit CPR
+Creates and upgrades every table once per process, tracked in schema_version
+"""
+
+import threading
+import db
+
+
+def _add_column(table: str, column: str):
+    def step(conn):
+        # A failed statement aborts a whole PostgreSQL transaction; the savepoint limits it to this one
+        conn.execute('SAVEPOINT add_column')
+        try:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column}')
+        except db.OperationalError:
+            conn.execute('ROLLBACK TO SAVEPOINT add_column')  # already present (SQLite has no ADD COLUMN IF NOT EXISTS)
+        conn.execute('RELEASE SAVEPOINT add_column')
+    return step
+
+
+# (version, name, steps); a step is an SQL statement or a callable taking the connection.
+# Every step must be safe to re-run: databases created before versioning already
+# have some of these tables.
+MIGRATIONS = [
+    (1, "core tables", [
+        '''CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            plan TEXT DEFAULT 'free',
+            reports_analyzed INTEGER DEFAULT 0,
+            disputes_purchased INTEGER DEFAULT 0
+        )''',
+        '''CREATE TABLE IF NOT EXISTS analysis_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            report_name TEXT,
+            errors_found INTEGER,
+            analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS dispute_letters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            bureau TEXT,
+            error_description TEXT,
+            status TEXT DEFAULT 'draft',
+            purchased BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )''',
+    ]),
+    (2, "dispute letter text", [_add_column('dispute_letters', 'letter_text TEXT')]),
+    (3, "admin tables", [
+        '''CREATE TABLE IF NOT EXISTS discount_codes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT UNIQUE NOT NULL,
+            discount_percent INTEGER,
+            plan_override TEXT,
+            uses_remaining INTEGER,
+            expires_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS user_overrides (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            override_type TEXT NOT NULL,
+            reason TEXT,
+            granted_by TEXT,
+            expires_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )''',
+    ]),
+    (4, "password reset tokens", [
+        '''CREATE TABLE IF NOT EXISTS password_reset_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            token TEXT UNIQUE NOT NULL,
+            expires_at TIMESTAMP NOT NULL,
+            used BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )''',
+    ]),
+    (5, "score and dispute trackers", [
+        '''CREATE TABLE IF NOT EXISTS score_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            bureau TEXT,
+            score INTEGER,
+            note TEXT,
+            logged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE TABLE IF NOT EXISTS dispute_reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            bureau TEXT,
+            dispute_description TEXT,
+            sent_date TEXT,
+            follow_up_date TEXT,
+            status TEXT DEFAULT 'pending'
+        )''',
+    ]),
+    (6, "parsed report cache", [
+        '''CREATE TABLE IF NOT EXISTS parsed_report_cache (
+            cache_key TEXT PRIMARY KEY,
+            prompt_version TEXT NOT NULL,
+            result_json TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_parsed_report_cache_last_used ON parsed_report_cache (last_used_at)',
+    ]),
+    (7, "per-user indexes", [
+        'CREATE INDEX IF NOT EXISTS idx_analysis_history_user ON analysis_history (user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_dispute_letters_user ON dispute_letters (user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_score_history_user_logged ON score_history (user_id, logged_at)',
+        'CREATE INDEX IF NOT EXISTS idx_dispute_reminders_user_follow_up ON dispute_reminders (user_id, follow_up_date)',
+    ]),
+    (8, "admin user listing", [
+        'CREATE INDEX IF NOT EXISTS idx_users_plan_id ON users (plan, id)',
+    ]),
+    (9, "stripe webhook events", [
+        '''CREATE TABLE IF NOT EXISTS stripe_events (
+            event_id TEXT PRIMARY KEY,
+            event_type TEXT NOT NULL,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        _add_column('users', 'stripe_customer_id TEXT'),
+        'CREATE INDEX IF NOT EXISTS idx_users_stripe_customer ON users (stripe_customer_id)',
+    ]),
+    (10, "user override lookup", [
+        'CREATE INDEX IF NOT EXISTS idx_user_overrides_user ON user_overrides (user_id, id)',
+    ]),
+    # Replaces password_reset_tokens, which kept raw tokens; links issued before this expire
+    (11, "hashed password resets", [
+        '''CREATE TABLE IF NOT EXISTS password_resets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            token_hash TEXT NOT NULL,
+            expires_at BIGINT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_password_resets_token_hash ON password_resets (token_hash)',
+        'CREATE INDEX IF NOT EXISTS idx_password_resets_user ON password_resets (user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_password_resets_expires ON password_resets (expires_at)',
+        'DROP TABLE IF EXISTS password_reset_tokens',
+    ]),
+    (12, "plan before a timed grant", [_add_column('user_overrides', 'previous_plan TEXT')]),
+    (13, "latest applied stripe event", [_add_column('users', 'stripe_event_at BIGINT')]),
+]
+
+_lock = threading.Lock()
+_done = False
+
+
+def current_version() -> int:
+    with db.transaction() as conn:
+        return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate() -> int:
+    """Apply pending migrations, each in its own transaction. Returns the schema version.
+
+    Only the first call in a process touches the database.
+    """
+    global _done
+    if _done:
+        return MIGRATIONS[-1][0]
+    with _lock:
+        if _done:
+            return MIGRATIONS[-1][0]
+        with db.transaction() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )''')
+        applied = current_version()
+        for version, name, steps in MIGRATIONS:
+            if version <= applied:
+                continue
+            with db.transaction() as conn:
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(step)
+                # Another instance may have applied it concurrently; the steps are idempotent
+                conn.execute('INSERT INTO schema_version (version, name) VALUES (?, ?) ON CONFLICT (version) DO NOTHING',
+                             (version, name))
+        _done = True
+    return MIGRATIONS[-1][0]
@@ -0,0 +1,160 @@
+"""
+Password Hashing for Credit CPR
+Self-describing scrypt/PBKDF2 hashes, verified off the script thread and upgraded on login
+"""
+
+import os
+import time
+import hmac
+import base64
+import hashlib
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Hash formats:
+#   scrypt$n=16384,r=8,p=1$<salt>$<hash>      (salt and hash urlsafe base64)
+#   pbkdf2_sha256$<iterations>$<salt>$<hash>
+#   legacy: 32 hex chars of salt + 64 hex chars of PBKDF2-SHA256, 100k iterations
+#   !<reason>: no password can sign in (e.g. "!google" for Google-only accounts)
+SCHEME = os.getenv("PASSWORD_SCHEME", "scrypt")
+SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+PBKDF2_ITERATIONS = int(os.getenv("PASSWORD_PBKDF2_ITERATIONS", "600000"))
+
+LEGACY_ITERATIONS = 100000
+KEY_BYTES = 32
+UNUSABLE_PREFIX = "!"
+
+# Hashing threads; the rest of the CPU stays free for rendering
+MAX_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Hash jobs allowed to queue before new ones are refused
+MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))
+WAIT_SECONDS = 10
+
+
+class HashingBusyError(Exception):
+    """Too many password checks are already queued"""
+
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="password-hash")
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p, dklen=KEY_BYTES)
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+
+
+def _make_hash(password: str) -> str:
+    salt = secrets.token_bytes(16)
+    if SCHEME == "pbkdf2_sha256":
+        return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(_pbkdf2(password, salt, PBKDF2_ITERATIONS))}"
+    key = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"scrypt$n={SCRYPT_N},r={SCRYPT_R},p={SCRYPT_P}${_b64(salt)}${_b64(key)}"
+
+
+def _check(password: str, stored: str) -> bool:
+    parts = stored.split("$")
+    if parts[0] == "scrypt" and len(parts) == 4:
+        params = dict(item.split("=") for item in parts[1].split(","))
+        key = _scrypt(password, _unb64(parts[2]), int(params["n"]), int(params["r"]), int(params["p"]))
+        return hmac.compare_digest(key, _unb64(parts[3]))
+    if parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+        key = _pbkdf2(password, _unb64(parts[2]), int(parts[1]))
+        return hmac.compare_digest(key, _unb64(parts[3]))
+    if len(stored) == 96 and "$" not in stored:
+        # The legacy format salted with the hex text itself
+        key = _pbkdf2(password, stored[:32].encode("utf-8"), LEGACY_ITERATIONS)
+        return hmac.compare_digest(key.hex(), stored[32:])
+    return False
+
+
+def _run(fn, *args):
+    if not _slots.acquire(timeout=WAIT_SECONDS):
+        raise HashingBusyError("Too many sign-in attempts in progress, please try again")
+    try:
+        return _executor.submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password: str) -> str:
+    """Hash a new password with the current scheme and parameters"""
+    return _run(_make_hash, password)
+
+
+def verify_password(password: str, stored: str) -> bool:
+    """Check a password against any supported hash format"""
+    if not stored or stored.startswith(UNUSABLE_PREFIX):
+        return False
+    try:
+        return _run(_check, password, stored)
+    except (ValueError, KeyError):
+        return False  # malformed hash
+
+
+def needs_rehash(stored: str) -> bool:
+    """True when stored was made with another scheme or weaker parameters than today's.
+
+    Hashes stronger than the current settings are kept as they are.
+    """
+    if not stored or stored.startswith(UNUSABLE_PREFIX):
+        return False
+    parts = stored.split("$")
+    try:
+        if SCHEME == "pbkdf2_sha256":
+            return parts[0] != "pbkdf2_sha256" or int(parts[1]) < PBKDF2_ITERATIONS
+        if parts[0] != "scrypt":
+            return True
+        params = {key: int(value) for key, value in (item.split("=") for item in parts[1].split(","))}
+        # Memory cost is N * r; parallelism p only adds CPU work
+        return (params["n"] * params["r"] < SCRYPT_N * SCRYPT_R
+                or params["n"] * params["r"] * params["p"] < SCRYPT_N * SCRYPT_R * SCRYPT_P)
+    except (IndexError, KeyError, ValueError):
+        return True  # unrecognized; replace it with a current hash
+
+
+def calibrate(target_ms: float = 250) -> dict:
+    """Pick scrypt N and PBKDF2 iterations that take about target_ms on this host"""
+    salt = secrets.token_bytes(16)
+
+    def timed(fn):
+        start = time.perf_counter()
+        fn()
+        return (time.perf_counter() - start) * 1000
+
+    n = 2 ** 12
+    while timed(lambda: _scrypt("benchmark", salt, n * 2, SCRYPT_R, SCRYPT_P)) <= target_ms and n < 2 ** 20:
+        n *= 2
+    sample = 100000
+    per_iteration = timed(lambda: _pbkdf2("benchmark", salt, sample)) / sample
+    iterations = max(int(target_ms / per_iteration) // 10000 * 10000, LEGACY_ITERATIONS)
+    return {
+        "scrypt_n": n,
+        "scrypt_ms": round(timed(lambda: _scrypt("benchmark", salt, n, SCRYPT_R, SCRYPT_P)), 1),
+        "pbkdf2_iterations": iterations,
+        "pbkdf2_ms": round(per_iteration * iterations, 1),
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    target = float(sys.argv[1]) if len(sys.argv) > 1 else 250
+    result = calibrate(target)
+    print(f"Target {target:.0f} ms per hash on this host:")
+    print(f"  PASSWORD_SCRYPT_N={result['scrypt_n']}  ({result['scrypt_ms']} ms)")
+    print(f"  PASSWORD_PBKDF2_ITERATIONS={result['pbkdf2_iterations']}  ({result['pbkdf2_ms']} ms)")
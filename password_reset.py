@@ -4,85 +4,60 @@ Handles forgot password flow with email verification
 """
 
 import streamlit as st
-import sqlite3
 import auth
+import db
+import time
+import hashlib
 import secrets
-from datetime import datetime, timedelta
+import threading
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
-def init_reset_table():
-    """Initialize password reset tokens table"""
-    conn = sqlite3.connect(auth.DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS password_reset_tokens (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            token TEXT UNIQUE NOT NULL,
-            expires_at TIMESTAMP NOT NULL,
-            used BOOLEAN DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+TOKEN_TTL_SECONDS = 3600  # Links expire in 1 hour
+
+# Expired rows are purged in batches this often, so the table stays small
+SWEEP_INTERVAL_SECONDS = 900
+SWEEP_BATCH = 500
+
+INVALID_LINK = "This reset link is invalid, expired or has already been used"
+
+def _digest(token):
+    # Only the digest is stored, so a leaked table can't be used to reset passwords
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
 
 def generate_reset_token(email):
-    """Generate a password reset token for a user"""
-    conn = sqlite3.connect(auth.DB_PATH)
-    c = conn.cursor()
-    
-    # Check if user exists
-    c.execute('SELECT id FROM users WHERE email = ?', (email,))
-    user = c.fetchone()
-    
-    if not user:
-        conn.close()
-        return None, "No account found with that email"
-    
-    user_id = user[0]
-    
-    # Generate token
+    """Generate a password reset token for a user, revoking any earlier ones"""
     token = secrets.token_urlsafe(32)
-    expires_at = datetime.now() + timedelta(hours=1)  # Token expires in 1 hour
-    
-    # Save token
-    c.execute('INSERT INTO password_reset_tokens (user_id, token, expires_at) VALUES (?, ?, ?)',
-              (user_id, token, expires_at))
-    
-    conn.commit()
-    conn.close()
+    with db.transaction() as conn:
+        c = conn.cursor()
+        
+        # Check if user exists
+        c.execute('SELECT id FROM users WHERE email = ?', (email,))
+        user = c.fetchone()
+        
+        if not user:
+            return None, "No account found with that email"
+        
+        user_id = user[0]
+        
+        # Only the newest link works
+        c.execute('DELETE FROM password_resets WHERE user_id = ?', (user_id,))
+        c.execute('INSERT INTO password_resets (user_id, token_hash, expires_at) VALUES (?, ?, ?)',
+                  (user_id, _digest(token), int(time.time()) + TOKEN_TTL_SECONDS))
     
     return token, None
 
 def verify_reset_token(token):
     """Verify a password reset token"""
-    conn = sqlite3.connect(auth.DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('''SELECT user_id, expires_at, used FROM password_reset_tokens 
-                 WHERE token = ?''', (token,))
-    result = c.fetchone()
-    
-    conn.close()
+    with db.transaction() as conn:
+        result = conn.execute('SELECT user_id FROM password_resets WHERE token_hash = ? AND expires_at > ?',
+                              (_digest(token), int(time.time()))).fetchone()
     
     if not result:
-        return None, "Invalid reset token"
-    
-    user_id, expires_at, used = result
-    
-    if used:
-        return None, "This reset link has already been used"
-    
-    if datetime.fromisoformat(expires_at) < datetime.now():
-        return None, "This reset link has expired"
+        return None, INVALID_LINK
     
-    return user_id, None
+    return result[0], None
 
 def reset_password(token, new_password):
     """Reset password using a valid token"""
@@ -94,20 +69,54 @@ def reset_password(token, new_password):
     # Hash new password
     password_hash = auth.hash_password(new_password)
     
-    conn = sqlite3.connect(auth.DB_PATH)
-    c = conn.cursor()
-    
-    # Update password
-    c.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user_id))
-    
-    # Mark token as used
-    c.execute('UPDATE password_reset_tokens SET used = 1 WHERE token = ?', (token,))
-    
-    conn.commit()
-    conn.close()
+    with db.transaction() as conn:
+        c = conn.cursor()
+        
+        # Consume the token; fails if another request used it since we checked
+        c.execute('DELETE FROM password_resets WHERE token_hash = ? AND expires_at > ? RETURNING user_id',
+                  (_digest(token), int(time.time())))
+        if c.fetchone() is None:
+            return False, INVALID_LINK
+        
+        # Update password
+        c.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user_id))
     
     return True, "Password reset successfully!"
 
+def purge_expired(batch_size=SWEEP_BATCH):
+    """Delete expired reset tokens, one short transaction per batch. Returns rows deleted."""
+    deleted = 0
+    while True:
+        with db.transaction() as conn:
+            c = conn.cursor()
+            c.execute('''DELETE FROM password_resets WHERE id IN (
+                SELECT id FROM password_resets WHERE expires_at <= ? LIMIT ?)''',
+                      (int(time.time()), batch_size))
+            count = c.rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+def _sweep_forever():
+    while True:
+        try:
+            purge_expired()
+        except Exception as e:
+            print(f"Password reset sweep failed: {e}")
+        time.sleep(SWEEP_INTERVAL_SECONDS)
+
+_sweeper_started = False
+_sweeper_lock = threading.Lock()
+
+def start_sweeper():
+    """Purge expired reset tokens from a daemon thread of this process, once"""
+    global _sweeper_started
+    with _sweeper_lock:
+        if _sweeper_started:
+            return
+        _sweeper_started = True
+    threading.Thread(target=_sweep_forever, name="password-reset-sweeper", daemon=True).start()
+
 def send_reset_email(email, token):
     """Send password reset email (placeholder - requires email configuration)"""
     # For now, just return the reset link
@@ -223,6 +232,3 @@ def handle_password_reset_flow():
         return True
     
     return False
-
-# Initialize table on import
-init_reset_table()
@@ -0,0 +1,140 @@
+"""
+PDF Text Extraction for Credit CPR
+Streams page text out of uploaded credit report PDFs
+"""
+
+import os
+import math
+import threading
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+import PyPDF2
+
+# Caps for uploaded reports (tri-bureau reports run 40-80 pages)
+MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "150"))
+MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(20 * 1024 * 1024)))
+
+# Files with at least this many pages are split across a process pool
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "24"))
+
+
+def _available_cpus() -> int:
+    """CPUs this container may use: affinity, capped by any cgroup CPU quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = os.cpu_count() or 1
+    quota = None
+    try:
+        # cgroup v2: "max 100000" or "<quota> <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            limit, period = f.read().split()[:2]
+        if limit != "max":
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1: a quota of -1 means unlimited
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                limit = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if limit > 0 and period > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    if quota:
+        cpus = min(cpus, math.ceil(quota))  # a partial CPU still runs one worker
+    return max(1, cpus)
+
+
+MAX_WORKERS = max(1, min(4, _available_cpus()))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PDFTooLargeError(ValueError):
+    pass
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking the multi-threaded Streamlit server can copy held locks
+            # into the child; workers start from a clean forkserver instead
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def read_pdf_bytes(pdf_file) -> bytes:
+    """Return the raw bytes of an uploaded file, path-like or bytes object"""
+    if isinstance(pdf_file, (bytes, bytearray)):
+        return bytes(pdf_file)
+    if isinstance(pdf_file, (str, os.PathLike)):
+        with open(pdf_file, "rb") as f:
+            return f.read()
+    if hasattr(pdf_file, "getvalue"):
+        return pdf_file.getvalue()
+    pdf_file.seek(0)
+    return pdf_file.read()
+
+
+def _extract_page_range(data: bytes, start: int, stop: int) -> list:
+    """Worker: decode pages [start, stop) from the PDF bytes"""
+    reader = PyPDF2.PdfReader(BytesIO(data))
+    return [(reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+
+def iter_pdf_pages(pdf_file, max_pages=MAX_PAGES, max_bytes=MAX_BYTES):
+    """Yield (page_number, page_count, text) for each page as it is decoded.
+
+    Small files are decoded inline. Larger files are split into contiguous
+    page ranges that are decoded in a process pool; pages are still yielded
+    in document order as soon as their range is ready.
+    """
+    data = read_pdf_bytes(pdf_file)
+    if max_bytes and len(data) > max_bytes:
+        raise PDFTooLargeError(
+            f"PDF is {len(data) // (1024 * 1024)} MB; the limit is {max_bytes // (1024 * 1024)} MB"
+        )
+
+    reader = PyPDF2.PdfReader(BytesIO(data))
+    page_count = len(reader.pages)
+    if max_pages and page_count > max_pages:
+        # Reading only the first pages would silently drop accounts listed later
+        raise PDFTooLargeError(f"PDF has {page_count} pages; the limit is {max_pages} pages")
+
+    if page_count < PARALLEL_MIN_PAGES or MAX_WORKERS < 2:
+        for i in range(page_count):
+            yield i + 1, page_count, reader.pages[i].extract_text() or ""
+        return
+
+    # Two ranges per worker keeps the first pages arriving quickly
+    range_size = max(1, -(-page_count // (MAX_WORKERS * 2)))
+    pool = _get_pool()
+    futures = [
+        pool.submit(_extract_page_range, data, start, min(start + range_size, page_count))
+        for start in range(0, page_count, range_size)
+    ]
+    page_number = 0
+    for future in futures:
+        for text in future.result():
+            page_number += 1
+            yield page_number, page_count, text
+
+
+def extract_text(pdf_file, max_pages=MAX_PAGES, max_bytes=MAX_BYTES, on_page=None) -> str:
+    """Extract the full text of a PDF, one line break after each page.
+
+    on_page(page_number, page_count) is called after every decoded page.
+    """
+    parts = []
+    for page_number, page_count, text in iter_pdf_pages(pdf_file, max_pages, max_bytes):
+        parts.append(text)
+        parts.append("\n")
+        if on_page:
+            on_page(page_number, page_count)
+    return "".join(parts)
@@ -0,0 +1,138 @@
+"""
+Login Rate Limiting for Credit CPR
+In-memory token buckets per email and per client, plus a cache of recently failed credentials
+"""
+
+import os
+import hmac
+import time
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+
+# Sign-in attempts: a burst of EMAIL_BURST per account, then one every EMAIL_REFILL_SECONDS
+EMAIL_BURST = int(os.getenv("LOGIN_EMAIL_BURST", "5"))
+EMAIL_REFILL_SECONDS = float(os.getenv("LOGIN_EMAIL_REFILL_SECONDS", "60"))
+CLIENT_BURST = int(os.getenv("LOGIN_CLIENT_BURST", "20"))
+CLIENT_REFILL_SECONDS = float(os.getenv("LOGIN_CLIENT_REFILL_SECONDS", "6"))
+
+# Keys tracked per limiter; the least recently seen are dropped first
+MAX_KEYS = int(os.getenv("LOGIN_LIMITER_MAX_KEYS", "50000"))
+# Failed (email, password, stored hash) checks remembered so replays skip hashing
+FAILED_CACHE_ENTRIES = 10000
+FAILED_CACHE_SECONDS = 15 * 60
+
+
+class TokenBucketLimiter:
+    """capacity tokens per key, refilled one every refill_seconds"""
+
+    def __init__(self, capacity: int, refill_seconds: float, max_keys: int = MAX_KEYS):
+        self.capacity = capacity
+        self.refill_seconds = refill_seconds
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _tokens(self, key, now):
+        tokens, updated_at = self._buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated_at) / self.refill_seconds)
+
+    def consume(self, key) -> bool:
+        """Take a token for key; False when the bucket is empty"""
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._tokens(key, now)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+            return allowed
+
+    def retry_after(self, key) -> float:
+        """Seconds until key has a token again"""
+        with self._lock:
+            tokens = self._tokens(key, time.monotonic())
+        return max(0.0, (1 - tokens) * self.refill_seconds)
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+_email_limiter = TokenBucketLimiter(EMAIL_BURST, EMAIL_REFILL_SECONDS)
+_client_limiter = TokenBucketLimiter(CLIENT_BURST, CLIENT_REFILL_SECONDS)
+
+# Keyed with a per-process secret so the cache never holds anything reversible
+_failed_key_secret = secrets.token_bytes(32)
+_failed = OrderedDict()  # digest -> expires_at
+_lock = threading.Lock()
+_stats = {"allowed": 0, "blocked": 0, "failed_cache_hits": 0, "failures": 0, "successes": 0}
+
+
+def check_login(email: str, client: str) -> tuple:
+    """Spend one attempt for this email and client. Returns (allowed, retry_after_seconds)."""
+    email = (email or "").strip().lower()
+    client = client or "unknown"
+    # Check both so a blocked client still drains its own bucket, not the account's
+    client_ok = _client_limiter.consume(client)
+    email_ok = client_ok and _email_limiter.consume(email)
+    with _lock:
+        _stats["allowed" if email_ok else "blocked"] += 1
+    if email_ok:
+        return True, 0.0
+    wait = _client_limiter.retry_after(client) if not client_ok else _email_limiter.retry_after(email)
+    return False, wait
+
+
+def _failed_key(email: str, password: str, stored_hash: str) -> bytes:
+    message = "\0".join(((email or "").strip().lower(), password, stored_hash or "")).encode("utf-8")
+    return hmac.new(_failed_key_secret, message, hashlib.sha256).digest()
+
+
+def known_failure(email: str, password: str, stored_hash: str) -> bool:
+    """True when this exact password already failed against this stored hash"""
+    key = _failed_key(email, password, stored_hash)
+    now = time.monotonic()
+    with _lock:
+        expires_at = _failed.get(key)
+        if expires_at is None:
+            return False
+        if expires_at <= now:
+            del _failed[key]
+            return False
+        _stats["failed_cache_hits"] += 1
+        return True
+
+
+def record_failure(email: str, password: str, stored_hash: str):
+    key = _failed_key(email, password, stored_hash)
+    with _lock:
+        _stats["failures"] += 1
+        _failed[key] = time.monotonic() + FAILED_CACHE_SECONDS
+        _failed.move_to_end(key)
+        while len(_failed) > FAILED_CACHE_ENTRIES:
+            _failed.popitem(last=False)
+
+
+def record_success(email: str):
+    """Give the account its full burst back after a good sign-in"""
+    _email_limiter.reset((email or "").strip().lower())
+    with _lock:
+        _stats["successes"] += 1
+
+
+def get_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+        stats["failed_cache_entries"] = len(_failed)
+    stats["tracked_emails"] = len(_email_limiter)
+    stats["tracked_clients"] = len(_client_limiter)
+    stats["evictions"] = _email_limiter.evictions + _client_limiter.evictions
+    return stats
@@ -0,0 +1,95 @@
+"""
+Parsed Report Cache for Credit CPR
+Memoizes structured credit report JSON by normalized text hash and prompt version
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import db
+
+TTL_SECONDS = int(os.getenv("REPORT_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+MAX_CACHE_BYTES = int(os.getenv("REPORT_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+
+def normalize_text(raw_text: str) -> str:
+    """Collapse whitespace so cosmetic extraction differences share a cache entry"""
+    return re.sub(r"\s+", " ", raw_text or "").strip()
+
+
+def make_key(raw_text: str, prompt_version: str) -> str:
+    digest = hashlib.sha256(normalize_text(raw_text).encode("utf-8")).hexdigest()
+    return f"{digest}:{prompt_version}"
+
+
+def get_parsed_report(raw_text: str, prompt_version: str):
+    """Return the cached structured report, or None on a miss or expired entry"""
+    key = make_key(raw_text, prompt_version)
+    now = time.time()
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute('SELECT result_json FROM parsed_report_cache WHERE cache_key = ? AND created_at > ?',
+                  (key, now - TTL_SECONDS))
+        row = c.fetchone()
+        if row:
+            c.execute('UPDATE parsed_report_cache SET last_used_at = ? WHERE cache_key = ?', (now, key))
+    with _lock:
+        _stats["hits" if row else "misses"] += 1
+    return json.loads(row[0]) if row else None
+
+
+def put_parsed_report(raw_text: str, prompt_version: str, result: dict):
+    """Store a structured report, dropping stale prompt versions and expired entries"""
+    key = make_key(raw_text, prompt_version)
+    payload = json.dumps(result, separators=(",", ":"))
+    now = time.time()
+    with db.transaction() as conn:
+        c = conn.cursor()
+        c.execute('''INSERT INTO parsed_report_cache
+                     (cache_key, prompt_version, result_json, size_bytes, created_at, last_used_at)
+                     VALUES (?, ?, ?, ?, ?, ?)
+                     ON CONFLICT(cache_key) DO UPDATE SET
+                         result_json = excluded.result_json,
+                         size_bytes = excluded.size_bytes,
+                         created_at = excluded.created_at,
+                         last_used_at = excluded.last_used_at''',
+                  (key, prompt_version, payload, len(payload), now, now))
+        c.execute('DELETE FROM parsed_report_cache WHERE prompt_version != ? OR created_at <= ?',
+                  (prompt_version, now - TTL_SECONDS))
+        evicted = c.rowcount
+        evicted += _evict_to_size(c)
+    with _lock:
+        _stats["writes"] += 1
+        _stats["evictions"] += max(evicted, 0)
+
+
+def _evict_to_size(c) -> int:
+    c.execute('SELECT COALESCE(SUM(size_bytes), 0) FROM parsed_report_cache')
+    total = c.fetchone()[0]
+    if total <= MAX_CACHE_BYTES:
+        return 0
+    c.execute('SELECT cache_key, size_bytes FROM parsed_report_cache ORDER BY last_used_at ASC')
+    victims = []
+    for cache_key, size_bytes in c.fetchall():
+        if total <= MAX_CACHE_BYTES:
+            break
+        victims.append((cache_key,))
+        total -= size_bytes
+    c.executemany('DELETE FROM parsed_report_cache WHERE cache_key = ?', victims)
+    return len(victims)
+
+
+def get_stats() -> dict:
+    with db.transaction() as conn:
+        entries, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM parsed_report_cache').fetchone()
+    with _lock:
+        stats = dict(_stats)
+    stats["entries"] = entries
+    stats["bytes"] = total
+    return stats
@@ -0,0 +1,136 @@
+"""
+Credit Report Chunking for Credit CPR
+Splits long reports on section boundaries and merges partial parses back together
+"""
+
+import re
+
+# Upper bound on the characters sent to the model per chunk
+CHUNK_CHARS = 15000
+
+SECTION_HEADERS = [
+    ("personal_info", r"personal (?:information|profile|data)|identification information|consumer information"),
+    ("accounts", r"(?:credit |adverse |negative |satisfactory |potentially negative |collection )?accounts?(?: information| summary| in good standing)?|collections|account history|trade ?lines"),
+    ("inquiries", r"(?:hard |soft |regular |promotional |account review )?inquiries|requests? for your credit (?:history|report)"),
+    ("public_records", r"public records?(?: information)?|bankruptc(?:y|ies)|judgments?"),
+]
+
+_HEADER_RE = re.compile(
+    r"^[ \t]*(?:" + "|".join(f"(?P<{name}>{pattern})" for name, pattern in SECTION_HEADERS) + r")[ \t]*:?[ \t]*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def find_sections(raw_text: str) -> list:
+    """Return [(section_type, text)] in document order.
+
+    Text before the first recognized header is labelled "preamble".
+    """
+    sections = []
+    last_type, last_start = "preamble", 0
+    for match in _HEADER_RE.finditer(raw_text):
+        if match.start() > last_start:
+            sections.append((last_type, raw_text[last_start:match.start()]))
+        last_type, last_start = match.lastgroup, match.start()
+    if last_start < len(raw_text):
+        sections.append((last_type, raw_text[last_start:]))
+    return [(kind, text) for kind, text in sections if text.strip()]
+
+
+def _split_oversized(text: str, max_chars: int) -> list:
+    """Split a single section on blank lines, then lines, to fit max_chars"""
+    pieces, current = [], []
+    size = 0
+    for block in re.split(r"(\n\s*\n)", text):
+        if size + len(block) > max_chars and current:
+            pieces.append("".join(current))
+            current, size = [], 0
+        while len(block) > max_chars:
+            cut = block.rfind("\n", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(block[:cut])
+            block = block[cut:]
+        current.append(block)
+        size += len(block)
+    if current:
+        pieces.append("".join(current))
+    return [p for p in pieces if p.strip()]
+
+
+def split_report(raw_text: str, max_chars: int = CHUNK_CHARS) -> list:
+    """Split a report into chunks of at most max_chars, cutting at section boundaries.
+
+    Returns a list of (section_types, chunk_text) where section_types is the
+    set of section kinds the chunk covers.
+    """
+    chunks = []
+    current, kinds = [], set()
+    size = 0
+    for kind, text in find_sections(raw_text):
+        parts = [text] if len(text) <= max_chars else _split_oversized(text, max_chars)
+        for part in parts:
+            if size + len(part) > max_chars and current:
+                chunks.append((kinds, "".join(current)))
+                current, kinds, size = [], set(), 0
+            current.append(part)
+            kinds.add(kind)
+            size += len(part)
+    if current:
+        chunks.append((kinds, "".join(current)))
+    return chunks
+
+
+def _norm(value) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(value or "").lower())
+
+
+def item_key(item: dict) -> tuple:
+    """Identity of an item for spotting exact repeats across chunks"""
+    return tuple(sorted((field, _norm(value)) for field, value in item.items()))
+
+
+def _merge_items(items: list) -> list:
+    """Drop exact repeats only (the same item parsed from two chunks).
+
+    Items that merely look alike stay: two tradelines for the same creditor
+    may be a genuine duplicate that the error rules need to see.
+    """
+    seen = set()
+    merged = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        key = item_key(item)
+        if key not in seen:
+            seen.add(key)
+            merged.append(dict(item))
+    return merged
+
+
+def merge_partials(partials: list) -> dict:
+    """Merge partial structured reports into one report, removing exact repeats"""
+    personal_info = {"name": "", "addresses": [], "ssn_last4": "", "dob": ""}
+    accounts, inquiries, public_records, negative_items = [], [], [], []
+
+    for partial in partials:
+        if not isinstance(partial, dict):
+            continue
+        info = partial.get("personal_info") or {}
+        for field in ("name", "ssn_last4", "dob"):
+            if not personal_info[field] and info.get(field):
+                personal_info[field] = info[field]
+        for address in info.get("addresses") or []:
+            if _norm(address) not in {_norm(a) for a in personal_info["addresses"]}:
+                personal_info["addresses"].append(address)
+        accounts.extend(partial.get("accounts") or [])
+        inquiries.extend(partial.get("inquiries") or [])
+        public_records.extend(partial.get("public_records") or [])
+        negative_items.extend(partial.get("negative_items") or [])
+
+    return {
+        "personal_info": personal_info,
+        "accounts": _merge_items(accounts),
+        "inquiries": _merge_items(inquiries),
+        "public_records": _merge_items(public_records),
+        "negative_items": _merge_items(negative_items),
+    }
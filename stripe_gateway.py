@@ -0,0 +1,111 @@
+"""
+Stripe Gateway for Credit CPR
+Keep-alive Stripe API client and a short-lived cache of customer and subscription lookups
+"""
+
+import os
+import time
+import threading
+import requests
+import stripe
+from requests.adapters import HTTPAdapter
+
+CONNECT_TIMEOUT = float(os.getenv("STRIPE_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("STRIPE_READ_TIMEOUT", "20"))
+MAX_NETWORK_RETRIES = 2
+
+# Customers rarely change; subscriptions change on checkout, cancel and renewal
+CUSTOMER_TTL_SECONDS = 600
+SUBSCRIPTION_TTL_SECONDS = 120
+# "Not found" answers expire sooner so a new checkout shows up quickly
+MISSING_TTL_SECONDS = 30
+MAX_ENTRIES = 2000
+
+_cache = {}  # (kind, key) -> (expires_at, value)
+_customer_ids = {}  # email -> customer id, for invalidating by email
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "api_calls": 0}
+
+
+def _configure():
+    # One pooled session for every thread; the default client keeps a session
+    # per thread, and Streamlit runs each rerun on a fresh thread
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    stripe.default_http_client = stripe.RequestsClient(timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), session=session)
+    stripe.max_network_retries = MAX_NETWORK_RETRIES
+
+
+def _get(kind, key):
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get((kind, key))
+        if entry and entry[0] > now:
+            _stats["hits"] += 1
+            return True, entry[1]
+        _stats["misses"] += 1
+        return False, None
+
+
+def _put(kind, key, value, ttl):
+    now = time.monotonic()
+    with _lock:
+        _stats["api_calls"] += 1
+        if len(_cache) >= MAX_ENTRIES:
+            for stale in [k for k, (expires_at, _) in _cache.items() if expires_at <= now]:
+                del _cache[stale]
+            if len(_cache) >= MAX_ENTRIES:
+                _cache.pop(next(iter(_cache)))
+        _cache[(kind, key)] = (now + (ttl if value is not None else MISSING_TTL_SECONDS), value)
+
+
+def get_customer(email: str):
+    """The first Stripe customer with this email, or None"""
+    found, customer = _get("customer", email)
+    if found:
+        return customer
+    customers = stripe.Customer.list(email=email, limit=1)
+    customer = customers.data[0] if customers.data else None
+    _put("customer", email, customer, CUSTOMER_TTL_SECONDS)
+    if customer is not None:
+        with _lock:
+            _customer_ids[email] = customer.id
+    return customer
+
+
+def get_active_subscription(customer_id: str):
+    """The customer's active subscription, or None"""
+    found, subscription = _get("subscription", customer_id)
+    if found:
+        return subscription
+    subscriptions = stripe.Subscription.list(customer=customer_id, status='active', limit=1)
+    subscription = subscriptions.data[0] if subscriptions.data else None
+    _put("subscription", customer_id, subscription, SUBSCRIPTION_TTL_SECONDS)
+    return subscription
+
+
+def get_checkout_session(session_id: str):
+    """A Checkout Session, fresh from Stripe (never cached: it is read once, on return from checkout)"""
+    with _lock:
+        _stats["api_calls"] += 1
+    return stripe.checkout.Session.retrieve(session_id)
+
+
+def invalidate(email: str = None, customer_id: str = None):
+    """Forget cached lookups after a checkout or subscription change"""
+    with _lock:
+        if email is not None:
+            _cache.pop(("customer", email), None)
+            customer_id = customer_id or _customer_ids.pop(email, None)
+        if customer_id is not None:
+            _cache.pop(("subscription", customer_id), None)
+
+
+def get_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+        stats["entries"] = len(_cache)
+    return stats
+
+
+_configure()
@@ -6,6 +6,7 @@ Handles subscriptions, checkouts, and webhooks
 import streamlit as st
 import stripe
 import os
+import stripe_gateway
 
 # Stripe Configuration - using environment variables only (no st.secrets)
 STRIPE_PUBLISHABLE_KEY = os.getenv("STRIPE_PUBLISHABLE_KEY", "")
@@ -17,7 +18,7 @@ STRIPE_PRICE_PRO = os.getenv("STRIPE_PRICE_PRO", "")
 stripe.api_key = STRIPE_SECRET_KEY
 
 
-def create_checkout_session(price_id, user_email, success_url, cancel_url):
+def create_checkout_session(price_id, user_email, success_url, cancel_url, plan=None):
     """Create a Stripe Checkout session for subscription"""
     try:
         checkout_session = stripe.checkout.Session.create(
@@ -28,10 +29,15 @@ def create_checkout_session(price_id, user_email, success_url, cancel_url):
                 'quantity': 1,
             }],
             mode='subscription',
-            success_url=success_url + '?session_id={CHECKOUT_SESSION_ID}',
+            success_url=success_url + '&session_id={CHECKOUT_SESSION_ID}',
             cancel_url=cancel_url,
+            # Read by the webhook to activate the plan without another API call
             metadata={
-                'user_email': user_email
+                'user_email': user_email,
+                'plan': plan or ''
+            },
+            subscription_data={
+                'metadata': {'user_email': user_email, 'plan': plan or ''}
             }
         )
         return checkout_session.url, None
@@ -54,10 +60,7 @@ def create_customer_portal_session(customer_id, return_url):
 def get_customer_by_email(email):
     """Get Stripe customer by email"""
     try:
-        customers = stripe.Customer.list(email=email, limit=1)
-        if customers.data:
-            return customers.data[0]
-        return None
+        return stripe_gateway.get_customer(email)
     except Exception as e:
         print(f"Error getting customer: {e}")
         return None
@@ -66,14 +69,7 @@ def get_customer_by_email(email):
 def get_customer_subscription(customer_id):
     """Get active subscription for a customer"""
     try:
-        subscriptions = stripe.Subscription.list(
-            customer=customer_id,
-            status='active',
-            limit=1
-        )
-        if subscriptions.data:
-            return subscriptions.data[0]
-        return None
+        return stripe_gateway.get_active_subscription(customer_id)
     except Exception as e:
         print(f"Error getting subscription: {e}")
         return None
@@ -142,7 +138,7 @@ def start_checkout(price_id, plan_name):
     success_url = "https://credit-cpr.onrender.com/?checkout=success"
     cancel_url = "https://credit-cpr.onrender.com/?checkout=cancel"
 
-    checkout_url, error = create_checkout_session(price_id, user_email, success_url, cancel_url)
+    checkout_url, error = create_checkout_session(price_id, user_email, success_url, cancel_url, plan_name)
 
     if checkout_url:
         st.success(f"✅ Redirecting to checkout for {plan_name.title()} plan...")
@@ -180,70 +176,49 @@ def show_manage_subscription():
         st.info("No customer record found")
 
 
-def update_user_plan_from_stripe(user_email, plan):
-    """Update user's plan in database after successful payment"""
-    import auth
-    import sqlite3
-
-    conn = sqlite3.connect(auth.DB_PATH)
-    c = conn.cursor()
-    c.execute('UPDATE users SET plan = ? WHERE email = ?', (plan, user_email))
-    conn.commit()
-    conn.close()
-
-    if st.session_state.get('user') and st.session_state.user['email'] == user_email:
-        st.session_state.user['plan'] = plan
-
-
 def handle_checkout_success():
-    """Handle successful checkout - called from within the app, not at module level"""
+    """Handle the redirect back from Checkout - called from within the app, not at module level.
+
+    The plan is normally applied by the Stripe webhook (stripe_webhook.py). When the
+    webhook hasn't arrived, the Checkout Session is fetched from Stripe and applied here.
+    """
     try:
         params = st.query_params
     except Exception:
         return
 
-    # Handle session_id from Stripe redirect
-    if 'session_id' in params:
-        session_id = params['session_id']
-        try:
-            session = stripe.checkout.Session.retrieve(session_id)
-            user_email = session.metadata.get('user_email') or session.customer_email
-
-            price_id = session.line_items.data[0].price.id if hasattr(session, 'line_items') else None
-
-            if price_id == STRIPE_PRICE_BASIC:
-                plan = 'basic'
-            elif price_id == STRIPE_PRICE_PRO:
-                plan = 'pro'
+    if 'session_id' in params or params.get('checkout') == 'success':
+        user = st.session_state.get('user')
+        if user:
+            import auth
+            import entitlements
+            import stripe_webhook
+            auth.invalidate_user_stats(user['id'])
+            entitlements.invalidate(user['id'])
+            stripe_gateway.invalidate(email=user['email'])
+            if params.get('session_id'):
+                try:
+                    session = stripe_gateway.get_checkout_session(params.get('session_id'))
+                    stripe_webhook.apply_checkout_session(session, user['email'])
+                except Exception as e:
+                    print(f"Error confirming checkout: {e}")
+            plan = entitlements.get(user['id'])['plan']
+            st.session_state.user['plan'] = plan
+            if plan == 'free':
+                st.success("🎉 Payment successful! Your upgrade is being confirmed and will appear within a few seconds.")
             else:
-                plan = 'premium'
-
-            update_user_plan_from_stripe(user_email, plan)
-
+                st.success("🎉 Payment successful! Your account has been upgraded!")
+        else:
             st.success("🎉 Payment successful! Your account has been upgraded!")
-            st.balloons()
-
-            try:
-                st.query_params.clear()
-            except Exception:
-                pass
-            st.rerun()
-
-        except Exception as e:
-            st.error(f"Error processing payment: {e}")
+        st.balloons()
+        try:
+            st.query_params.clear()
+        except Exception:
+            pass
 
-    # Handle checkout=success/cancel query param
-    elif 'checkout' in params:
-        if params['checkout'] == 'success':
-            st.success("🎉 Payment successful! Your account has been upgraded!")
-            st.balloons()
-            try:
-                st.query_params.clear()
-            except Exception:
-                pass
-        elif params['checkout'] == 'cancel':
-            st.warning("Payment cancelled. You can upgrade anytime!")
-            try:
-                st.query_params.clear()
-            except Exception:
-                pass
+    elif params.get('checkout') == 'cancel':
+        st.warning("Payment cancelled. You can upgrade anytime!")
+        try:
+            st.query_params.clear()
+        except Exception:
+            pass
@@ -0,0 +1,263 @@
+"""
+Stripe Webhook Receiver for Credit CPR
+Verifies Stripe events, records each one once in stripe_events, and applies plan changes in batches
+
+Run standalone with `python stripe_webhook.py` (listens on $PORT, default 8502), e.g. as
+its own Render web service, or set STRIPE_WEBHOOK_PORT to have the app start it on a
+background thread. Point the Stripe endpoint at /stripe/webhook and send it the
+checkout.session.completed, checkout.session.async_payment_succeeded and
+customer.subscription.* events.
+
+Without a reachable webhook, apply_checkout_session() activates the plan when the
+customer returns from Checkout; both paths record the change once.
+"""
+
+import os
+import hmac
+import time
+import queue
+import hashlib
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import stripe
+import db
+import migrations
+
+WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
+WEBHOOK_PATH = "/stripe/webhook"
+MAX_BODY_BYTES = 1024 * 1024
+
+# Events arriving within this window share one transaction
+BATCH_WINDOW_SECONDS = 0.2
+MAX_BATCH = 100
+
+ACTIVE_STATUSES = ("active", "trialing")
+# Other statuses (incomplete, past_due) leave the plan as it is
+ENDED_STATUSES = ("canceled", "unpaid", "incomplete_expired")
+
+# Delayed payment methods complete checkout unpaid, then confirm with async_payment_succeeded
+CHECKOUT_EVENTS = ("checkout.session.completed", "checkout.session.async_payment_succeeded")
+PAID_CHECKOUT_STATUSES = ("paid", "no_payment_required")
+
+
+def _price_plans() -> dict:
+    prices = {
+        os.getenv("STRIPE_PRICE_BASIC", ""): "basic",
+        os.getenv("STRIPE_PRICE_PRO", ""): "pro",
+    }
+    prices.pop("", None)
+    return prices
+
+
+def sign_payload(payload: bytes, secret: str = None, timestamp: int = None) -> str:
+    """A Stripe-Signature header for payload, for exercising the endpoint with local fixtures"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signed = f"{timestamp}.".encode("utf-8") + payload
+    secret = WEBHOOK_SECRET if secret is None else secret
+    signature = hmac.new(secret.encode("utf-8"), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def plan_change(event):
+    """What an event means for our users: (match_column, match_value, plan, customer_id) or None"""
+    obj = event["data"]["object"]
+    event_type = event["type"]
+    if event_type in CHECKOUT_EVENTS:
+        if obj.get("payment_status") not in PAID_CHECKOUT_STATUSES:
+            return None
+        metadata = obj.get("metadata") or {}
+        email = metadata.get("user_email") or obj.get("customer_email")
+        plan = metadata.get("plan")
+        if email and plan:
+            return "email", email, plan, obj.get("customer")
+    elif event_type.startswith("customer.subscription."):
+        metadata = obj.get("metadata") or {}
+        # Subscriptions from our checkout carry the email, so they match even if
+        # they arrive before checkout.session.completed has stored the customer id
+        match = ("email", metadata["user_email"]) if metadata.get("user_email") else ("stripe_customer_id", obj.get("customer"))
+        if event_type == "customer.subscription.deleted" or obj.get("status") in ENDED_STATUSES:
+            return match + ("free", obj.get("customer"))
+        if obj.get("status") in ACTIVE_STATUSES:
+            items = (obj.get("items") or {}).get("data") or []
+            price_id = items[0]["price"]["id"] if items else None
+            plan = metadata.get("plan") or _price_plans().get(price_id)
+            if plan:
+                return match + (plan, obj.get("customer"))
+    return None
+
+
+def apply_events(events) -> list:
+    """Record and apply events in one transaction; returns True per event if it was new.
+
+    Stripe doesn't deliver events in order, so a user's plan only changes for
+    events created no earlier than the last one applied to them.
+    """
+    fresh = []
+    touched = []
+    with db.transaction() as conn:
+        for event in events:
+            inserted = conn.execute(
+                'INSERT INTO stripe_events (event_id, event_type) VALUES (?, ?) '
+                'ON CONFLICT (event_id) DO NOTHING RETURNING event_id',
+                (event["id"], event["type"])).fetchone()
+            fresh.append(inserted is not None)
+            if inserted is None:
+                continue  # a retry of an event already applied
+            change = plan_change(event)
+            if change is None:
+                continue
+            column, value, plan, customer_id = change
+            created = int(event.get("created") or time.time())
+            rows = conn.execute(
+                f'UPDATE users SET plan = ?, stripe_customer_id = COALESCE(?, stripe_customer_id), stripe_event_at = ? '
+                f'WHERE {column} = ? AND (stripe_event_at IS NULL OR stripe_event_at <= ?) RETURNING id, email',
+                (plan, customer_id, created, value, created)).fetchall()
+            # Supersedes any timed admin grant, which would otherwise lapse this plan
+            conn.executemany(
+                "INSERT INTO user_overrides (user_id, override_type, reason, granted_by) VALUES (?, ?, ?, 'stripe')",
+                [(user_id, f"plan_{plan}", event["type"]) for user_id, _ in rows])
+            touched.extend((user_id, email, customer_id) for user_id, email in rows)
+    _invalidate(touched)
+    return fresh
+
+
+def apply_checkout_session(session, email: str):
+    """Apply a completed Checkout Session retrieved from Stripe for this user.
+
+    The fallback for when no webhook reached us; returns the activated plan or None.
+    """
+    metadata = session.get("metadata") or {}
+    owner = metadata.get("user_email") or session.get("customer_email")
+    if session.get("status") != "complete" or session.get("payment_status") not in PAID_CHECKOUT_STATUSES:
+        return None
+    if not owner or owner.lower() != (email or "").lower() or not metadata.get("plan"):
+        return None
+    # Keyed by session, so returning twice (or reloading the page) applies it once
+    apply_events([{"id": f"checkout:{session['id']}", "type": "checkout.session.completed",
+                   "created": session.get("created"), "data": {"object": session}}])
+    return metadata["plan"]
+
+
+def _invalidate(touched):
+    # Effective when running inside the app process; otherwise the caches' TTLs apply
+    import auth
+    import entitlements
+    import stripe_gateway
+    for user_id, email, customer_id in touched:
+        auth.invalidate_user_stats(user_id)
+        entitlements.invalidate(user_id)
+        stripe_gateway.invalidate(email=email, customer_id=customer_id)
+
+
+class _Batcher:
+    """Collects events from request threads and commits them together"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name="stripe-webhook-batcher", daemon=True).start()
+
+    def submit(self, event) -> Future:
+        future = Future()
+        self._queue.put((event, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + BATCH_WINDOW_SECONDS
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                results = apply_events([event for event, _ in batch])
+                for (_, future), fresh in zip(batch, results):
+                    future.set_result(fresh)
+            except Exception:
+                # Retry one by one so a single bad event doesn't fail its neighbours
+                for event, future in batch:
+                    try:
+                        future.set_result(apply_events([event])[0])
+                    except Exception as e:
+                        future.set_exception(e)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def _get_batcher() -> _Batcher:
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = _Batcher()
+    return _batcher
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != WEBHOOK_PATH:
+            return self._reply(404, "not found")
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0 or length > MAX_BODY_BYTES:
+            return self._reply(400, "bad request")
+        payload = self.rfile.read(length)
+        try:
+            event = stripe.Webhook.construct_event(payload, self.headers.get("Stripe-Signature", ""), WEBHOOK_SECRET)
+        except ValueError:
+            return self._reply(400, "invalid payload")
+        except stripe.error.SignatureVerificationError:
+            return self._reply(400, "invalid signature")
+        try:
+            # Reply only once the event is committed, so Stripe retries anything lost
+            fresh = _get_batcher().submit(event).result(timeout=30)
+        except Exception:
+            return self._reply(500, "error")
+        self._reply(200, "ok" if fresh else "duplicate")
+
+    def _reply(self, status: int, message: str):
+        body = message.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Stripe retries are noisy; failures are visible in the Stripe dashboard
+
+
+def make_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    if not WEBHOOK_SECRET:
+        # Without a secret, anyone could sign events with an empty HMAC key
+        raise RuntimeError("STRIPE_WEBHOOK_SECRET is not set; refusing to accept webhooks")
+    migrations.migrate()
+    return ThreadingHTTPServer((host, port), WebhookHandler)
+
+
+_started = False
+
+
+def start_background(port: int = None):
+    """Serve webhooks from a daemon thread of this process, once, if a port is configured"""
+    global _started
+    port = port or int(os.getenv("STRIPE_WEBHOOK_PORT") or 0)
+    if not port:
+        return
+    if not WEBHOOK_SECRET:
+        print(f"STRIPE_WEBHOOK_PORT is set but STRIPE_WEBHOOK_SECRET is not; not serving webhooks on :{port}")
+        return
+    with _batcher_lock:
+        if _started:
+            return
+        _started = True
+    server = make_server(port)
+    threading.Thread(target=server.serve_forever, name="stripe-webhook", daemon=True).start()
+
+
+if __name__ == "__main__":
+    port = int(os.getenv("PORT") or "8502")
+    print(f"Listening for Stripe webhooks on :{port}{WEBHOOK_PATH}")
+    make_server(port).serve_forever()
@@ -0,0 +1,81 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def report_text():
+    """Read a fixture report from tests/fixtures/reports by file stem"""
+    def read(name):
+        with open(os.path.join(FIXTURES, "reports", f"{name}.txt"), encoding="utf-8") as f:
+            return f.read()
+    return read
+
+
+def _reset_caches():
+    import auth
+    import entitlements
+    auth.invalidate_user_stats()
+    entitlements.invalidate()
+
+
+def _use_backend(backend):
+    import db
+    import migrations
+    previous = db._backend
+    db._backend = backend
+    migrations._done = False
+    migrations.migrate()
+    _reset_caches()
+    return previous
+
+
+def _restore_backend(previous):
+    import db
+    import migrations
+    db._backend = previous
+    migrations._done = False
+    _reset_caches()
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """A migrated, empty SQLite database for the duration of one test"""
+    import db
+    previous = _use_backend(db.SQLiteBackend(str(tmp_path / "users.db")))
+    yield db.get_backend()
+    _restore_backend(previous)
+
+
+@pytest.fixture
+def postgres_db():
+    """A migrated, empty PostgreSQL database; needs TEST_DATABASE_URL.
+
+    Point it at a scratch database: its public schema is dropped and recreated.
+    """
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    import db
+    conn = db.psycopg2.connect(url)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public")
+    conn.close()
+    backend = db.PostgresBackend(url)
+    previous = _use_backend(backend)
+    yield backend
+    _restore_backend(previous)
+    backend._pool.closeall()
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def database(request):
+    """Runs a test once per storage backend"""
+    return request.getfixturevalue(f"{request.param}_db")
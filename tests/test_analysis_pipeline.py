@@ -0,0 +1,115 @@
+import threading
+
+import analysis_pipeline
+
+FILLER = "x" * 70 + "\n"
+# Two sections, each too big to share a chunk with the other
+TWO_CHUNK_TEXT = "CHUNK-A\n" + FILLER * 130 + "INQUIRIES\nCHUNK-B\n" + FILLER * 130
+
+CHASE = {"creditor": "CHASE", "account_num": "XXXX1234", "balance": 500, "status": "Open",
+         "payment_history": "", "date_opened": "03/2015", "date_of_first_delinquency": "", "bureau": "Experian"}
+LATE = {"description": "CHASE - 30 days late", "date": "09/2024"}
+
+
+def partial(accounts=(), negative_items=()):
+    return {"personal_info": {"name": "JANE DOE", "addresses": [], "ssn_last4": "", "dob": ""},
+            "accounts": list(accounts), "inquiries": [], "public_records": [],
+            "negative_items": list(negative_items)}
+
+
+def run(parse_chunk, analyze_section, **kwargs):
+    return list(analysis_pipeline.run_analysis(TWO_CHUNK_TEXT, parse_chunk, analyze_section, **kwargs))
+
+
+def test_items_repeated_across_chunks_are_analyzed_once():
+    seen = []
+    lock = threading.Lock()
+
+    def parse_chunk(chunk):
+        # Both chunks repeat the same account and negative item
+        return partial([CHASE], [LATE])
+
+    def analyze_section(section_data, flagged):
+        with lock:
+            seen.append(section_data)
+        return []
+
+    run(parse_chunk, analyze_section)
+    accounts = [a for data in seen for a in data["accounts"]]
+    negatives = [n for data in seen for n in data["negative_items"]]
+    assert accounts == [CHASE]
+    assert negatives == [LATE]
+    assert sum(1 for data in seen if data["personal_info"]) == 1
+
+
+def test_duplicate_account_across_chunks_is_flagged():
+    def parse_chunk(chunk):
+        repeat = dict(CHASE, payment_history="OK OK 30")
+        return partial([CHASE] if "CHUNK-A" in chunk else [repeat])
+
+    events = run(parse_chunk, lambda section_data, flagged: [])
+    _, _, errors, _, _, _ = events[-1]
+    assert [e["category"] for e in errors] == ["Duplicate Account"]
+
+
+def test_tri_bureau_copies_are_not_duplicates():
+    def parse_chunk(chunk):
+        # The same tradeline as each bureau prints it
+        return partial([CHASE] if "CHUNK-A" in chunk else [
+            dict(CHASE, account_num="4147XXXXXXXX1234", balance=510, bureau="Equifax"),
+            dict(CHASE, bureau="TransUnion"),
+        ])
+
+    events = run(parse_chunk, lambda section_data, flagged: [])
+    _, _, errors, _, _, _ = events[-1]
+    assert errors == []
+
+
+def test_model_errors_are_deduplicated():
+    def analyze_section(section_data, flagged):
+        return [{"category": "Personal Information Error", "affected_item": "Jane Doe", "source": "model"}]
+
+    events = run(lambda chunk: partial([CHASE], [LATE]), analyze_section)
+    _, _, errors, _, _, _ = events[-1]
+    assert [e["id"] for e in errors] == ["ERR001"]
+
+
+def test_failed_parse_returns_a_private_empty_report():
+    events = run(lambda chunk: None, lambda section_data, flagged: [])
+    _, credit_data, errors, fully_parsed_by_ai, failed_chunks, _ = events[-1]
+    assert failed_chunks == 2
+    assert credit_data == analysis_pipeline.EMPTY_REPORT
+    assert credit_data is not analysis_pipeline.EMPTY_REPORT
+    credit_data["accounts"].append(CHASE)
+    assert analysis_pipeline.EMPTY_REPORT["accounts"] == []
+    assert errors == [] and not fully_parsed_by_ai
+
+
+def test_partial_failure_is_not_cacheable():
+    events = run(lambda chunk: partial([CHASE]) if "CHUNK-A" in chunk else None,
+                 lambda section_data, flagged: [])
+    _, credit_data, _, fully_parsed_by_ai, failed_chunks, _ = events[-1]
+    assert credit_data["accounts"] == [CHASE]
+    assert failed_chunks == 1
+    assert not fully_parsed_by_ai
+
+
+def test_parse_exceptions_are_counted_as_failures():
+    def parse_chunk(chunk):
+        raise RuntimeError("model unavailable")
+
+    events = run(parse_chunk, lambda section_data, flagged: [])
+    _, _, _, fully_parsed_by_ai, failed_chunks, _ = events[-1]
+    assert failed_chunks == 2 and not fully_parsed_by_ai
+
+
+def test_failed_analyses_are_counted():
+    def analyze_section(section_data, flagged):
+        if section_data["accounts"]:
+            raise RuntimeError("model unavailable")
+        return None if section_data["negative_items"] else []
+
+    events = run(lambda chunk: partial([CHASE], [LATE]), analyze_section)
+    _, _, errors, fully_parsed_by_ai, failed_chunks, failed_analyses = events[-1]
+    assert (failed_chunks, failed_analyses) == (0, 2)
+    assert fully_parsed_by_ai and errors == []
@@ -0,0 +1,14 @@
+import auth
+
+
+def test_forwarded_client_uses_the_proxy_appended_entry():
+    assert auth.forwarded_client("203.0.113.7", trusted_hops=1) == "203.0.113.7"
+    # A client-supplied header is prepended to what the proxy saw
+    assert auth.forwarded_client("1.2.3.4, 5.6.7.8, 203.0.113.7", trusted_hops=1) == "203.0.113.7"
+    assert auth.forwarded_client("1.2.3.4, 203.0.113.7, 10.0.0.2", trusted_hops=2) == "203.0.113.7"
+
+
+def test_forwarded_client_edge_cases():
+    assert auth.forwarded_client("", trusted_hops=1) == ""
+    assert auth.forwarded_client(" , ", trusted_hops=1) == ""
+    assert auth.forwarded_client("203.0.113.7", trusted_hops=3) == "203.0.113.7"
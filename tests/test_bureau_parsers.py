@@ -0,0 +1,139 @@
+from datetime import date
+
+import pytest
+
+import analysis_pipeline
+import bureau_parsers
+import error_rules
+
+KNOWN_LAYOUTS = [
+    ("experian", "experian"),
+    ("equifax", "equifax"),
+    ("transunion", "transunion"),
+    ("annualcreditreport_experian", "experian"),
+    ("annualcreditreport_equifax", "equifax"),
+    ("annualcreditreport_transunion", "transunion"),
+]
+
+
+@pytest.mark.parametrize("fixture, layout", KNOWN_LAYOUTS)
+def test_detect_layout(report_text, fixture, layout):
+    assert bureau_parsers.detect_layout(report_text(fixture)) == layout
+
+
+def test_detect_layout_unknown(report_text):
+    assert bureau_parsers.detect_layout(report_text("unknown_layout")) is None
+
+
+@pytest.mark.parametrize("fixture, layout", KNOWN_LAYOUTS)
+def test_parse_known_layout_schema(report_text, fixture, layout):
+    report = bureau_parsers.parse_known_layout(report_text(fixture))
+    assert report is not None
+    assert set(report) == {"personal_info", "accounts", "inquiries", "public_records", "negative_items"}
+    assert report["personal_info"]["name"]
+    assert report["accounts"]
+    for account in report["accounts"]:
+        assert set(account) >= {"creditor", "account_num", "balance", "status", "payment_history",
+                                "date_opened", "bureau"}
+        assert account["bureau"] == bureau_parsers.LAYOUTS[layout]["bureau"]
+        assert isinstance(account["balance"], int)
+
+
+def test_parse_experian(report_text):
+    report = bureau_parsers.parse_known_layout(report_text("experian"))
+    assert report["personal_info"] == {
+        "name": "JANE Q DOE",
+        "addresses": ["123 MAIN ST, SPRINGFIELD, IL 62701", "45 OAK AVE, CHICAGO, IL 60601"],
+        "ssn_last4": "6789",
+        "dob": "1985",
+    }
+    assert [a["creditor"] for a in report["accounts"]] == [
+        "CAPITAL ONE", "MIDLAND CREDIT MANAGEMENT", "SYNCHRONY BANK/AMAZON"]
+    assert report["accounts"][1]["balance"] == 2430
+    assert [a["date_opened"] for a in report["accounts"]] == ["03/2015", "06/2019", "08/2012"]
+    assert report["inquiries"] == [
+        {"company": "DISCOVER BANK", "date": "02/03/2024"},
+        {"company": "TOYOTA MOTOR CREDIT", "date": "11/20/2023"},
+    ]
+    assert report["public_records"] == [{"type": "Chapter 7 Bankruptcy", "status": "Discharged", "date": "04/2012"}]
+
+
+def test_parse_creditor_headings_without_labels(report_text):
+    report = bureau_parsers.parse_known_layout(report_text("annualcreditreport_transunion"))
+    assert [a["creditor"] for a in report["accounts"]] == ["BANK OF AMERICA", "NAVIENT"]
+
+
+def test_never_late_accounts_are_not_negative(report_text):
+    report = bureau_parsers.parse_known_layout(report_text("experian"))
+    described = [item["description"] for item in report["negative_items"]]
+    assert not any(d.startswith("CAPITAL ONE") for d in described)
+    assert len(described) == 2
+
+
+def test_negative_items_dated_by_first_delinquency_only(report_text):
+    report = bureau_parsers.parse_known_layout(report_text("experian"))
+    assert [item["date"] for item in report["negative_items"]] == ["11/2016", "09/2024"]
+    # No delinquency label: undated rather than dated by "Date Opened"
+    report = bureau_parsers.parse_known_layout(report_text("annualcreditreport_transunion"))
+    assert report["negative_items"] == [{"description": "BANK OF AMERICA - Paid, Closed; was 60 days late", "date": ""}]
+
+
+def test_clean_account_is_not_flagged_obsolete(report_text):
+    report = bureau_parsers.parse_known_layout(report_text("experian"))
+    errors, _ = error_rules.evaluate(report, today=date(2025, 1, 15))
+    obsolete = [e["affected_item"] for e in errors if e["category"] == "Obsolete Information"]
+    assert not any("CAPITAL ONE" in item for item in obsolete)
+    assert not any("SYNCHRONY" in item for item in obsolete)
+    assert any("MIDLAND" in item for item in obsolete)
+
+
+@pytest.mark.parametrize("status, negative", [
+    ("Open/Never late.", False),
+    ("Paid, Closed/Never late", False),
+    ("Current; never late", False),
+    ("No late payments", False),
+    ("Pays as agreed", False),
+    ("Open, 0 times late", False),
+    ("Collection", True),
+    ("Charged Off", True),
+    ("Open. 30 days past due", True),
+    ("Paid, Closed; was 60 days late", True),
+    ("Repossession", True),
+])
+def test_is_negative_status(status, negative):
+    assert bureau_parsers.is_negative_status(status) is negative
+
+
+def test_incomplete_parse_falls_back(report_text):
+    # A recognized banner but nothing parseable: the caller must use the AI parser
+    text = report_text("experian").split("ACCOUNTS")[0]
+    assert bureau_parsers.parse_known_layout(text) is None
+
+
+def test_unknown_layout_falls_back_to_ai_parser(report_text):
+    text = report_text("unknown_layout")
+    parsed_chunks = []
+
+    def parse_chunk(chunk):
+        parsed_chunks.append(chunk)
+        return {"personal_info": {"name": "ALEX P TURNER"}, "accounts": [], "inquiries": [],
+                "public_records": [], "negative_items": []}
+
+    events = list(analysis_pipeline.run_analysis(
+        text, parse_chunk, lambda section, flagged: [],
+        preparsed=bureau_parsers.parse_known_layout(text)))
+    assert parsed_chunks == [text]
+    assert events[-1][0] == "complete"
+    assert events[-1][1]["personal_info"]["name"] == "ALEX P TURNER"
+
+
+def test_known_layout_skips_ai_parser(report_text):
+    text = report_text("equifax")
+
+    def parse_chunk(chunk):
+        raise AssertionError("known layouts are parsed locally")
+
+    events = list(analysis_pipeline.run_analysis(
+        text, parse_chunk, lambda section, flagged: [],
+        preparsed=bureau_parsers.parse_known_layout(text)))
+    assert events[-1][1]["personal_info"]["name"] == "JOHN A SMITH"
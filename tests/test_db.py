@@ -0,0 +1,90 @@
+import pytest
+
+import db
+import migrations
+
+
+def test_to_postgres_placeholders_skip_literals():
+    sql = "SELECT id FROM t WHERE note = 'why?' AND name = ? AND \"odd?col\" = ? -- any?\n"
+    assert db.to_postgres(sql) == "SELECT id FROM t WHERE note = 'why?' AND name = %s AND \"odd?col\" = %s -- any?\n"
+
+
+def test_to_postgres_escapes_percent_everywhere():
+    assert db.to_postgres("SELECT 'it''s 100%' WHERE a LIKE ?") == "SELECT 'it''s 100%%' WHERE a LIKE %s"
+    # Without parameters psycopg2 does no interpolation, so nothing changes
+    assert db.to_postgres("SELECT '100%?'", has_params=False) == "SELECT '100%?'"
+
+
+def test_to_postgres_ddl():
+    sql = db.to_postgres("CREATE TABLE t (id INTEGER PRIMARY KEY AUTOINCREMENT, ok BOOLEAN, x REAL)", False)
+    assert sql == "CREATE TABLE t (id SERIAL PRIMARY KEY, ok INTEGER, x DOUBLE PRECISION)"
+    assert db.to_postgres("ALTER TABLE t ADD COLUMN y TEXT", False) == "ALTER TABLE t ADD COLUMN IF NOT EXISTS y TEXT"
+
+
+def test_migrate_is_idempotent(database):
+    version = migrations.MIGRATIONS[-1][0]
+    migrations._done = False
+    assert migrations.migrate() == version
+    assert migrations.current_version() == version
+    # Re-running an ADD COLUMN step leaves the transaction usable
+    with db.transaction() as conn:
+        migrations._add_column("users", "stripe_customer_id TEXT")(conn)
+        assert conn.execute("SELECT COUNT(*) FROM users").fetchone() == (0,)
+
+
+def test_literal_question_mark_round_trip(database):
+    with db.transaction() as conn:
+        assert conn.execute("SELECT 'why?', ?", ("yes",)).fetchone() == ("why?", "yes")
+
+
+def test_values_come_back_like_sqlite(database):
+    with db.transaction() as conn:
+        conn.execute("INSERT INTO users (email, password_hash) VALUES (?, ?)", ("a@x.com", "!test"))
+        conn.execute("INSERT INTO users (email, password_hash, reports_analyzed) VALUES (?, ?, ?)", ("b@x.com", "!test", 2))
+        created_at, total = conn.execute(
+            "SELECT MIN(created_at), SUM(reports_analyzed) FROM users").fetchone()
+    assert isinstance(created_at, str) and len(created_at) >= 19
+    assert total == 2 and isinstance(total, int)
+
+
+def test_integrity_error_is_normalized(database):
+    with db.transaction() as conn:
+        conn.execute("INSERT INTO users (email, password_hash) VALUES (?, ?)", ("a@x.com", "!test"))
+    with pytest.raises(db.IntegrityError):
+        with db.transaction() as conn:
+            conn.execute("INSERT INTO users (email, password_hash) VALUES (?, ?)", ("a@x.com", "!test"))
+    with db.transaction() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM users").fetchone() == (1,)
+
+
+def test_nested_transactions_roll_back_together(database):
+    with pytest.raises(RuntimeError):
+        with db.transaction() as outer:
+            outer.execute("INSERT INTO users (email, password_hash) VALUES (?, ?)", ("a@x.com", "!test"))
+            with db.transaction() as inner:
+                assert inner is outer
+            raise RuntimeError("abort")
+    with db.transaction() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM users").fetchone() == (0,)
+
+
+def test_user_flows(database):
+    import auth
+    import password_reset
+
+    assert auth.create_user("jane@x.com", "correct horse")[0]
+    assert not auth.create_user("jane@x.com", "correct horse")[0]
+    ok, user = auth.authenticate_user("jane@x.com", "correct horse", client="test")
+    assert ok and user["plan"] == "free"
+
+    page = auth.get_users_page(email_prefix="jane")
+    assert [row[1] for row in page] == ["jane@x.com"]
+    assert isinstance(page[0][5], str)
+    assert auth.count_users(plan="free") == 1
+
+    token, error = password_reset.generate_reset_token("jane@x.com")
+    assert error is None
+    assert password_reset.reset_password(token, "new password 1")[0]
+    assert not password_reset.reset_password(token, "new password 2")[0]
+    assert password_reset.purge_expired() == 0
+    assert auth.authenticate_user("jane@x.com", "new password 1", client="test")[0]
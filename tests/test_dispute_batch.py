@@ -0,0 +1,44 @@
+import threading
+
+import dispute_batch
+
+USER = {"name": "JANE DOE", "address": "1 Elm St\nSpringfield, IL 62701", "ssn_last4": "6789", "dob": "1985"}
+ERRORS = [
+    {"category": "Account Error", "affected_item": "CHASE", "description": "Balance is wrong"},
+    {"category": "Unauthorized Inquiry", "affected_item": "DISCOVER BANK", "description": "Unknown inquiry"},
+]
+
+
+def test_one_paragraph_per_error_rendered_for_every_bureau():
+    calls = []
+    lock = threading.Lock()
+
+    def paragraph_fn(error):
+        with lock:
+            calls.append(error["affected_item"])
+        return f"Paragraph about {error['affected_item']}."
+
+    progress = []
+    letters = dispute_batch.generate_all(ERRORS, USER, paragraph_fn,
+                                         on_progress=lambda done, total: progress.append((done, total)))
+    assert sorted(calls) == ["CHASE", "DISCOVER BANK"]
+    assert [(l["error"]["affected_item"], l["bureau"]) for l in letters] == [
+        (item, bureau) for item in ("CHASE", "DISCOVER BANK") for bureau in dispute_batch.BUREAUS]
+    for letter in letters:
+        assert letter["failure"] is None
+        assert f"Paragraph about {letter['error']['affected_item']}." in letter["letter_text"]
+    assert "P.O. Box 740256" in letters[0]["letter_text"]
+    assert "P.O. Box 2000" in letters[2]["letter_text"]
+    assert progress == [(3, 6), (6, 6)]
+
+
+def test_a_failed_paragraph_fails_that_error_for_every_bureau():
+    def paragraph_fn(error):
+        if error["affected_item"] == "CHASE":
+            raise RuntimeError("model unavailable")
+        return "Paragraph."
+
+    letters = dispute_batch.generate_all(ERRORS, USER, paragraph_fn)
+    assert [l["failure"] for l in letters[:3]] == ["model unavailable"] * 3
+    assert all(l["letter_text"] is None for l in letters[:3])
+    assert all(l["letter_text"] for l in letters[3:])
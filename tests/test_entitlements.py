@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import admin_system
+import auth
+import db
+import entitlements
+
+
+class SessionState(dict):
+    __getattr__ = dict.__getitem__
+
+
+@pytest.fixture
+def admin_session(monkeypatch):
+    # Outside a Streamlit run there is no session to keep the signed-in admin
+    state = SessionState(user={"id": 0, "email": "admin@x.com"})
+    monkeypatch.setattr(admin_system, "st", SimpleNamespace(session_state=state))
+
+
+def make_user(email, plan="free"):
+    assert auth.create_user(email, "correct horse")[0]
+    with db.transaction() as conn:
+        user_id = conn.execute("SELECT id FROM users WHERE email = ?", (email,)).fetchone()[0]
+        conn.execute("UPDATE users SET plan = ? WHERE id = ?", (plan, user_id))
+    entitlements.invalidate(user_id)
+    return user_id
+
+
+def expire_grants(user_id):
+    with db.transaction() as conn:
+        conn.execute("UPDATE user_overrides SET expires_at = ? WHERE user_id = ? AND expires_at IS NOT NULL",
+                     (datetime.now() - timedelta(minutes=1), user_id))
+    entitlements.invalidate(user_id)
+
+
+def test_features_follow_the_plan(database):
+    user_id = make_user("free@x.com")
+    assert not entitlements.has_feature(user_id, "score_tracker")
+    auth.update_user_plan(user_id, "basic")
+    assert entitlements.has_feature(user_id, "score_tracker")
+    assert auth.can_analyze_report(user_id) == (True, "Unlimited analyses")
+
+
+def test_timed_grant_lapses_to_free(database, admin_session):
+    user_id = make_user("trial@x.com")
+    assert admin_system.grant_user_access("trial@x.com", "pro", duration_days=7)[0]
+    assert entitlements.get(user_id)["plan"] == "pro"
+    assert entitlements.get(user_id)["override_expires_at"] is not None
+    expire_grants(user_id)
+    assert entitlements.get(user_id)["plan"] == "free"
+
+
+def test_timed_grant_lapses_to_the_previous_paid_plan(database, admin_session):
+    # Paid before the webhook existed: no Stripe override row
+    user_id = make_user("subscriber@x.com", plan="pro")
+    assert admin_system.grant_user_access("subscriber@x.com", "pro", duration_days=7)[0]
+    expire_grants(user_id)
+    assert entitlements.get(user_id)["plan"] == "pro"
+
+
+def test_stacked_grants_lapse_to_the_plan_beneath_them(database, admin_session):
+    user_id = make_user("stacked@x.com", plan="basic")
+    assert admin_system.grant_user_access("stacked@x.com", "pro", duration_days=7)[0]
+    assert admin_system.grant_user_access("stacked@x.com", "premium", duration_days=7)[0]
+    expire_grants(user_id)
+    assert entitlements.get(user_id)["plan"] == "basic"
+
+
+def test_grants_without_a_recorded_previous_plan_do_not_lapse(database):
+    user_id = make_user("legacy@x.com", plan="pro")
+    with db.transaction() as conn:
+        conn.execute("INSERT INTO user_overrides (user_id, override_type, expires_at) VALUES (?, 'plan_pro', ?)",
+                     (user_id, datetime.now() - timedelta(days=1)))
+    entitlements.invalidate(user_id)
+    assert entitlements.get(user_id)["plan"] == "pro"
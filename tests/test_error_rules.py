@@ -0,0 +1,102 @@
+from datetime import date
+
+import error_rules
+
+TODAY = date(2025, 1, 15)
+
+
+def report(accounts=(), negative_items=(), personal_info=None):
+    return {
+        "personal_info": personal_info or {"name": "", "addresses": [], "ssn_last4": "", "dob": ""},
+        "accounts": list(accounts),
+        "inquiries": [],
+        "public_records": [],
+        "negative_items": list(negative_items),
+    }
+
+
+def categories(errors):
+    return [e["category"] for e in errors]
+
+
+def test_obsolete_runs_from_first_delinquency():
+    data = report(accounts=[{"creditor": "MIDLAND", "account_num": "8800XXXX", "balance": 2430,
+                             "status": "Collection", "date_of_first_delinquency": "11/2016"}])
+    errors, residual = error_rules.evaluate(data, today=TODAY)
+    assert categories(errors) == ["Obsolete Information"]
+    assert residual["accounts"] == []
+
+
+def test_old_account_with_recent_delinquency_is_not_obsolete():
+    data = report(accounts=[{"creditor": "SYNCHRONY", "account_num": "6045XXXX9921", "balance": 310,
+                             "status": "30 days past due", "date_opened": "08/2012",
+                             "date_of_first_delinquency": "09/2024"}])
+    errors, _ = error_rules.evaluate(data, today=TODAY)
+    assert errors == []
+
+
+def test_account_without_delinquency_date_is_not_obsolete():
+    data = report(accounts=[{"creditor": "CHASE", "account_num": "4400XXXX1111", "balance": 10,
+                             "status": "Charged off", "date": "01/2010"}])
+    errors, _ = error_rules.evaluate(data, today=TODAY)
+    assert errors == []
+
+
+def test_obsolete_account_is_not_flagged_again_as_negative_item():
+    data = report(
+        accounts=[{"creditor": "MIDLAND", "account_num": "8800XXXX", "balance": 2430,
+                   "status": "Collection", "date_of_first_delinquency": "11/2016"}],
+        negative_items=[{"description": "MIDLAND - Collection", "date": "11/2016"}])
+    errors, _ = error_rules.evaluate(data, today=TODAY)
+    assert categories(errors) == ["Obsolete Information"]
+
+
+def test_duplicate_needs_the_same_number_open_date_and_balance():
+    chase = {"creditor": "CHASE", "account_num": "XXXX1234", "balance": 500, "status": "Open",
+             "date_opened": "03/2015", "bureau": "Experian"}
+    data = report(accounts=[
+        chase,
+        dict(chase, creditor="Chase", status="Open/Current", date_opened="03/01/2015"),
+        dict(chase, account_num="4147XXXXXXXX1234"),
+        dict(chase, balance=510),
+        dict(chase, date_opened="04/2015"),
+        dict(chase, account_num="XXXX9876"),
+    ])
+    errors, _ = error_rules.evaluate(data, today=TODAY)
+    assert categories(errors) == ["Duplicate Account"]
+
+
+def test_copies_from_different_bureaus_are_not_duplicates():
+    chase = {"creditor": "CHASE", "account_num": "XXXX1234", "balance": 500, "status": "Open",
+             "date_opened": "03/2015"}
+    data = report(accounts=[dict(chase, bureau=bureau) for bureau in ("Experian", "Equifax", "TransUnion")])
+    errors, _ = error_rules.evaluate(data, today=TODAY)
+    assert errors == []
+
+
+def test_zero_balance_accounts_without_numbers_are_not_duplicates():
+    data = report(accounts=[
+        {"creditor": "CHASE", "account_num": "", "balance": 0, "status": "Paid, closed"},
+        {"creditor": "CHASE", "account_num": "", "balance": 0, "status": "Paid, closed"},
+    ])
+    errors, _ = error_rules.evaluate(data, today=TODAY)
+    assert errors == []
+
+
+def test_accounts_without_a_number_or_open_date_are_never_duplicates():
+    account = {"creditor": "LVNV", "account_num": "", "balance": 620, "status": "Collection",
+               "payment_history": "C C", "date_opened": "01/2021", "date_of_first_delinquency": "01/2022"}
+    errors, _ = error_rules.evaluate(report(accounts=[account, dict(account)]), today=TODAY)
+    assert errors == []
+    account = dict(account, account_num="8800XXXX", date_opened="")
+    errors, _ = error_rules.evaluate(report(accounts=[account, dict(account)]), today=TODAY)
+    assert errors == []
+
+
+def test_personal_info_counts_as_residual():
+    data = report(accounts=[{"creditor": "MIDLAND", "account_num": "8800XXXX", "balance": 2430,
+                             "status": "Collection", "date_of_first_delinquency": "11/2016"}],
+                  personal_info={"name": "JANE DOE", "addresses": [], "ssn_last4": "", "dob": ""})
+    _, residual = error_rules.evaluate(data, today=TODAY)
+    assert error_rules.has_residual_items(residual)
+    assert not error_rules.has_residual_items(report())
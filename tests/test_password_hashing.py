@@ -0,0 +1,53 @@
+import pytest
+
+import auth
+import password_hashing
+
+
+def test_round_trip():
+    stored = password_hashing.hash_password("correct horse")
+    assert password_hashing.verify_password("correct horse", stored)
+    assert not password_hashing.verify_password("wrong horse", stored)
+    assert not password_hashing.needs_rehash(stored)
+
+
+def test_unusable_hash_never_verifies():
+    assert not password_hashing.verify_password("!google", "!google")
+    assert not password_hashing.needs_rehash("!google")
+
+
+@pytest.mark.parametrize("stored, rehash", [
+    ("scrypt$n=32768,r=8,p=1$c2FsdA$aGFzaA", False),   # stronger memory cost
+    ("scrypt$n=16384,r=8,p=2$c2FsdA$aGFzaA", False),   # more parallel work
+    ("scrypt$n=16384,r=8,p=1$c2FsdA$aGFzaA", False),   # current settings
+    ("scrypt$n=8192,r=8,p=1$c2FsdA$aGFzaA", True),     # weaker
+    ("pbkdf2_sha256$600000$c2FsdA$aGFzaA", True),      # other scheme
+    ("ab" * 48, True),                                 # legacy hex
+    ("scrypt$garbage$x$y", True),
+])
+def test_needs_rehash_only_for_weaker_hashes(monkeypatch, stored, rehash):
+    monkeypatch.setattr(password_hashing, "SCHEME", "scrypt")
+    monkeypatch.setattr(password_hashing, "SCRYPT_N", 16384)
+    monkeypatch.setattr(password_hashing, "SCRYPT_R", 8)
+    monkeypatch.setattr(password_hashing, "SCRYPT_P", 1)
+    assert password_hashing.needs_rehash(stored) is rehash
+
+
+def test_pbkdf2_iterations(monkeypatch):
+    monkeypatch.setattr(password_hashing, "SCHEME", "pbkdf2_sha256")
+    monkeypatch.setattr(password_hashing, "PBKDF2_ITERATIONS", 600000)
+    assert not password_hashing.needs_rehash("pbkdf2_sha256$900000$c2FsdA$aGFzaA")
+    assert password_hashing.needs_rehash("pbkdf2_sha256$100000$c2FsdA$aGFzaA")
+    assert password_hashing.needs_rehash("scrypt$n=16384,r=8,p=1$c2FsdA$aGFzaA")
+
+
+def test_busy_hashing_asks_to_try_again(sqlite_db, monkeypatch):
+    assert auth.create_user("busy@x.com", "correct horse")[0]
+
+    def busy(*args):
+        raise password_hashing.HashingBusyError("busy")
+
+    monkeypatch.setattr(password_hashing, "_run", busy)
+    ok, result = auth.authenticate_user("busy@x.com", "correct horse", client="test-busy")
+    assert not ok
+    assert "try again" in result["error"]
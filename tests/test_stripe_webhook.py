@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import auth
+import entitlements
+import stripe_webhook
+from conftest import FIXTURES
+
+SECRET = "whsec_test_secret"
+
+
+def fixture_payload(name):
+    with open(os.path.join(FIXTURES, "stripe", f"{name}.json"), "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def webhook(database, monkeypatch):
+    """A webhook server on a free local port, signing secret SECRET"""
+    monkeypatch.setattr(stripe_webhook, "WEBHOOK_SECRET", SECRET)
+    monkeypatch.setenv("STRIPE_PRICE_BASIC", "price_basic_test")
+    server = stripe_webhook.make_server(0, host="127.0.0.1")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def jane(database):
+    assert auth.create_user("jane@x.com", "correct horse")[0]
+    ok, user = auth.authenticate_user("jane@x.com", "correct horse", client="test-webhook")
+    assert ok
+    return user
+
+
+def test_refuses_to_start_without_a_secret(monkeypatch):
+    monkeypatch.setattr(stripe_webhook, "WEBHOOK_SECRET", "")
+    monkeypatch.setattr(stripe_webhook, "_started", False)
+    with pytest.raises(RuntimeError):
+        stripe_webhook.make_server(0, host="127.0.0.1")
+    stripe_webhook.start_background(port=8599)
+    assert not stripe_webhook._started
+
+
+def post(url, payload, signature):
+    request = urllib.request.Request(url + stripe_webhook.WEBHOOK_PATH, data=payload,
+                                     headers={"Stripe-Signature": signature, "Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+
+
+def send(url, name):
+    payload = fixture_payload(name)
+    return post(url, payload, stripe_webhook.sign_payload(payload, SECRET))
+
+
+def plan_of(user):
+    entitlements.invalidate(user["id"])
+    return entitlements.get(user["id"])["plan"]
+
+
+def test_checkout_completed_activates_plan_once(webhook, jane):
+    assert send(webhook, "checkout_session_completed") == (200, "ok")
+    assert plan_of(jane) == "pro"
+    # Stripe retries deliver the same event id again
+    assert send(webhook, "checkout_session_completed") == (200, "duplicate")
+
+
+def test_unpaid_checkout_waits_for_the_async_payment(webhook, jane):
+    assert send(webhook, "checkout_session_completed_unpaid") == (200, "ok")
+    assert plan_of(jane) == "free"
+    assert send(webhook, "checkout_session_async_payment_succeeded") == (200, "ok")
+    assert plan_of(jane) == "pro"
+
+
+def test_subscription_lifecycle(webhook, jane):
+    assert send(webhook, "checkout_session_completed")[0] == 200
+    # Matched by the customer id stored from checkout; plan from the price id
+    assert send(webhook, "customer_subscription_updated") == (200, "ok")
+    assert plan_of(jane) == "basic"
+    assert send(webhook, "customer_subscription_deleted") == (200, "ok")
+    assert plan_of(jane) == "free"
+
+
+def test_late_events_do_not_undo_newer_ones(webhook, jane):
+    assert send(webhook, "checkout_session_completed")[0] == 200
+    assert send(webhook, "customer_subscription_deleted") == (200, "ok")
+    # The update was created before the cancellation but delivered after it
+    assert send(webhook, "customer_subscription_updated") == (200, "ok")
+    assert plan_of(jane) == "free"
+    # Nor does the checkout-return fallback for the original session
+    stripe_webhook.apply_checkout_session(checkout_session(id="cs_test_replay"), "jane@x.com")
+    assert plan_of(jane) == "free"
+
+
+def test_rejects_bad_signatures(webhook, jane):
+    payload = fixture_payload("checkout_session_completed")
+    assert post(webhook, payload, stripe_webhook.sign_payload(payload, "whsec_wrong"))[0] == 400
+    assert post(webhook, payload, stripe_webhook.sign_payload(payload, SECRET, timestamp=1))[0] == 400
+    tampered = payload.replace(b'"pro"', b'"premium"')
+    assert post(webhook, tampered, stripe_webhook.sign_payload(payload, SECRET))[0] == 400
+    assert post(webhook, payload, stripe_webhook.sign_payload(payload, ""))[0] == 400
+    assert plan_of(jane) == "free"
+
+
+def checkout_session(**changes):
+    session = json.loads(fixture_payload("checkout_session_completed"))["data"]["object"]
+    session.update(changes)
+    return session
+
+
+def test_checkout_return_fallback(jane):
+    assert stripe_webhook.apply_checkout_session(checkout_session(), "JANE@x.com") == "pro"
+    assert plan_of(jane) == "pro"
+    # Reloading the success page applies it once
+    stripe_webhook.apply_checkout_session(checkout_session(), "jane@x.com")
+    from db import transaction
+    with transaction() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM stripe_events").fetchone() == (1,)
+
+
+@pytest.mark.parametrize("changes, email", [
+    ({"payment_status": "unpaid"}, "jane@x.com"),
+    ({"status": "open"}, "jane@x.com"),
+    ({}, "mallory@x.com"),
+])
+def test_checkout_return_fallback_needs_a_paid_session_for_this_user(jane, changes, email):
+    assert stripe_webhook.apply_checkout_session(checkout_session(**changes), email) is None
+    assert plan_of(jane) == "free"
@@ -0,0 +1,56 @@
+import os
+import time
+
+import pytest
+
+import text_cache
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_cache, "CACHE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _age(digest, seconds):
+    path = text_cache._path(digest)
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_round_trip(cache_dir):
+    text_cache.put_text("abc", "EQUIFAX report")
+    assert text_cache.get_text("abc") == "EQUIFAX report"
+    assert text_cache.get_text("missing") is None
+
+
+def test_expired_text_is_a_miss_and_deleted(cache_dir):
+    text_cache.put_text("abc", "EQUIFAX report")
+    _age("abc", text_cache.TTL_SECONDS + 60)
+    assert text_cache.get_text("abc") is None
+    assert not os.path.exists(text_cache._path("abc"))
+
+
+def test_reads_do_not_extend_the_ttl(cache_dir):
+    text_cache.put_text("abc", "EQUIFAX report")
+    _age("abc", text_cache.TTL_SECONDS - 60)
+    assert text_cache.get_text("abc") == "EQUIFAX report"
+    assert os.stat(text_cache._path("abc")).st_mtime <= time.time() - text_cache.TTL_SECONDS + 60
+
+
+def test_writes_sweep_expired_entries(cache_dir):
+    text_cache.put_text("old", "TRANSUNION report")
+    _age("old", text_cache.TTL_SECONDS + 60)
+    text_cache.put_text("new", "EXPERIAN report")
+    assert sorted(os.listdir(cache_dir)) == ["new.txt"]
+
+
+def test_size_eviction_drops_least_recently_read(cache_dir, monkeypatch):
+    monkeypatch.setattr(text_cache, "MAX_CACHE_BYTES", 25)
+    text_cache.put_text("a", "x" * 10)
+    text_cache.put_text("b", "x" * 10)
+    _age("a", 120)
+    _age("b", 60)
+    assert text_cache.get_text("a") == "x" * 10  # now the most recently used
+    text_cache.put_text("c", "x" * 10)
+    assert sorted(os.listdir(cache_dir)) == ["a.txt", "c.txt"]
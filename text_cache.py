@@ -0,0 +1,119 @@
+"""
+Extracted Text Cache for Credit CPR
+Content-addressed on-disk cache of PDF text, keyed by SHA-256 of the upload
+"""
+
+import os
+import time
+import hashlib
+import threading
+import auth
+import report_cache
+
+# Lives on the persistent disk next to the user database
+CACHE_DIR = os.path.join(os.path.dirname(auth.DB_PATH), "text_cache")
+MAX_CACHE_BYTES = int(os.getenv("TEXT_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+# Report text is kept no longer than the parses made from it. Like
+# report_cache, entries expire by when they were written (mtime) and are
+# evicted least recently used first (atime, set explicitly on each hit)
+TTL_SECONDS = report_cache.TTL_SECONDS
+
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+
+def pdf_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _path(digest: str) -> str:
+    return os.path.join(CACHE_DIR, f"{digest}.txt")
+
+
+def get_text(digest: str):
+    """Return cached text for a PDF digest, or None on a miss or expired entry"""
+    path = _path(digest)
+    now = time.time()
+    try:
+        written_at = os.stat(path).st_mtime
+        if written_at <= now - TTL_SECONDS:
+            os.remove(path)
+            raise FileNotFoundError(path)
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        # Mark the entry recently used, keeping its write time for expiry
+        os.utime(path, (now, written_at))
+    except (FileNotFoundError, OSError):
+        with _lock:
+            _stats["misses"] += 1
+        return None
+    with _lock:
+        _stats["hits"] += 1
+    return text
+
+
+def put_text(digest: str, text: str):
+    """Store text for a PDF digest, then evict least recently used entries"""
+    path = _path(digest)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError:
+        return
+    with _lock:
+        _stats["writes"] += 1
+    _evict()
+
+
+def _evict():
+    entries = []
+    total = 0
+    evicted = 0
+    expired_before = time.time() - TTL_SECONDS
+    for entry in os.scandir(CACHE_DIR):
+        if not entry.name.endswith(".txt"):
+            continue
+        try:
+            info = entry.stat()
+            if info.st_mtime <= expired_before:
+                os.remove(entry.path)
+                evicted += 1
+                continue
+        except FileNotFoundError:
+            continue
+        entries.append((info.st_atime, info.st_size, entry.path))
+        total += info.st_size
+    entries.sort()
+    for _, size, path in entries:
+        if total <= MAX_CACHE_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        evicted += 1
+    with _lock:
+        _stats["evictions"] += evicted
+
+
+def get_stats() -> dict:
+    """Counters for this process plus the current on-disk footprint"""
+    entries = 0
+    total = 0
+    for entry in os.scandir(CACHE_DIR):
+        if entry.name.endswith(".txt"):
+            entries += 1
+            try:
+                total += entry.stat().st_size
+            except FileNotFoundError:
+                pass
+    with _lock:
+        stats = dict(_stats)
+    stats["entries"] = entries
+    stats["bytes"] = total
+    return stats